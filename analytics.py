@@ -0,0 +1,232 @@
+#!/usr/bin/env -S uv run
+
+'''
+Append-only, columnar store of game events, for statistics.
+One partition (directory) per room. Each column is a flat binary file
+of fixed-size values, so appending is cheap and reading a column is a
+single `array.fromfile`. Player names are dictionary-encoded.
+Usage: `python analytics.py [room]` prints a summary.
+'''
+
+from __future__ import annotations
+
+import typing as tp
+import os
+import sys
+import math
+import json
+import time
+import asyncio
+from array import array
+from enum import IntEnum
+
+ANALYTICS_DIR = './logs/analytics'
+
+# Rows are written in batches of this many, or this often.
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 10.0 # sec
+
+class Kind(IntEnum):
+    CALL_SET = 0    # value: seconds since the last harvest
+    HARVEST = 1     # value: seconds since the last harvest
+    DEAL = 2        # value: number of cards dealt
+    UNDO = 3
+    NEW_GAME = 4
+
+# column name -> array typecode
+COLUMNS = {
+    'time': 'd',
+    'kind': 'B',
+    'player': 'I',
+    'value': 'd',
+}
+STRINGS = 'strings.jsonl'
+
+class Table(tp.NamedTuple):
+    time: array
+    kind: array
+    player: array
+    value: array
+    strings: tp.List[str]
+
+def emptyColumns():
+    return {name: array(typecode) for name, typecode in COLUMNS.items()}
+
+class AnalyticsWriter:
+    '''
+    Buffers rows in memory. The owner flushes them when `isDue`, with 
+    `flush` or, from the event loop, `flushInThread`.  
+    '''
+    def __init__(self, room: str, root_dir: str = ANALYTICS_DIR):
+        self.dir = os.path.join(root_dir, room)
+        os.makedirs(self.dir, exist_ok=True)
+        truncateColumns(self.dir)
+        self.string_ids = {
+            s: i for i, s in enumerate(loadStrings(self.dir))
+        }
+        self.new_strings: tp.List[str] = []
+        self.columns = emptyColumns()
+        self.last_flush = time.time()
+        # Batches are written in the order they were taken. 
+        self.lock = asyncio.Lock()
+
+    def record(self, kind: Kind, player: str, value: float = 0.0):
+        try:
+            player_id = self.string_ids[player]
+        except KeyError:
+            player_id = self.string_ids[player] = len(self.string_ids)
+            self.new_strings.append(player)
+        now = time.time()
+        self.columns['time'].append(now)
+        self.columns['kind'].append(kind)
+        self.columns['player'].append(player_id)
+        self.columns['value'].append(value)
+
+    def isDue(self):
+        return bool(self.columns['time']) and (
+            len(self.columns['time']) >= BATCH_SIZE or
+            time.time() - self.last_flush >= FLUSH_INTERVAL
+        )
+
+    def takeBatch(self):
+        self.last_flush = time.time()
+        columns, self.columns = self.columns, emptyColumns()
+        new_strings, self.new_strings = self.new_strings, []
+        return columns, new_strings
+
+    def writeBatch(self, columns: tp.Dict[str, array], new_strings: tp.List[str]):
+        if not columns['time']:
+            return
+        # Strings first, so that a crash never leaves a dangling id.
+        if new_strings:
+            with open(os.path.join(self.dir, STRINGS), 'a') as f:
+                for s in new_strings:
+                    f.write(json.dumps(s) + '\n')
+        # A crash in between leaves some columns longer. The next 
+        # writer truncates them. 
+        for name, column in columns.items():
+            with open(os.path.join(self.dir, name + '.bin'), 'ab') as f:
+                column.tofile(f)
+
+    def flush(self):
+        self.writeBatch(*self.takeBatch())
+
+    async def flushInThread(self):
+        batch = self.takeBatch()
+        async with self.lock:
+            await asyncio.to_thread(self.writeBatch, *batch)
+
+def truncateColumns(dir_: str):
+    '''
+    Cuts every column to the shortest one, undoing a crash mid-flush, 
+    so that appends line up again.  
+    '''
+    sizes = {}
+    for name in COLUMNS:
+        try:
+            sizes[name] = os.path.getsize(os.path.join(dir_, name + '.bin'))
+        except FileNotFoundError:
+            sizes[name] = 0
+    itemsizes = {name: array(typecode).itemsize for name, typecode in COLUMNS.items()}
+    n_rows = min(sizes[name] // itemsizes[name] for name in COLUMNS)
+    for name in COLUMNS:
+        if sizes[name] != n_rows * itemsizes[name]:
+            os.truncate(os.path.join(dir_, name + '.bin'), n_rows * itemsizes[name])
+
+def loadStrings(dir_: str):
+    try:
+        with open(os.path.join(dir_, STRINGS), 'r') as f:
+            return [json.loads(line) for line in f]
+    except FileNotFoundError:
+        return []
+
+def loadTable(dir_: str):
+    columns = emptyColumns()
+    for name, column in columns.items():
+        path = os.path.join(dir_, name + '.bin')
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            continue
+        with open(path, 'rb') as f:
+            column.fromfile(f, size // column.itemsize)
+    # A crash mid-flush may leave some columns longer.
+    n_rows = min(len(column) for column in columns.values())
+    return Table(
+        **{name: column[:n_rows] for name, column in columns.items()},
+        strings=loadStrings(dir_),
+    )
+
+def listRooms(root_dir: str = ANALYTICS_DIR):
+    try:
+        return sorted(os.listdir(root_dir))
+    except FileNotFoundError:
+        return []
+
+class PlayerStats:
+    def __init__(self):
+        self.n_sets = 0
+        self.total_time_to_set = 0.0
+        self.n_calls = 0
+        self.total_call_time = 0.0
+        self.n_dealt = 0
+        self.n_undos = 0
+
+    def meanTimeToSet(self):
+        return self.total_time_to_set / self.n_sets if self.n_sets else math.nan
+
+    def meanCallTime(self):
+        return self.total_call_time / self.n_calls if self.n_calls else math.nan
+
+def summarize(table: Table):
+    '''
+    Per-player stats, and sets per minute of the whole room.
+    '''
+    stats: tp.Dict[int, PlayerStats] = {}
+    for kind, player, value in zip(table.kind, table.player, table.value):
+        try:
+            s = stats[player]
+        except KeyError:
+            s = stats[player] = PlayerStats()
+        if kind == Kind.HARVEST:
+            s.n_sets += 1
+            s.total_time_to_set += value
+        elif kind == Kind.CALL_SET:
+            s.n_calls += 1
+            s.total_call_time += value
+        elif kind == Kind.DEAL:
+            s.n_dealt += round(value)
+        elif kind == Kind.UNDO:
+            s.n_undos += 1
+    n_sets = table.kind.count(Kind.HARVEST)
+    if len(table.time) >= 2 and table.time[-1] > table.time[0]:
+        sets_per_minute = n_sets / (table.time[-1] - table.time[0]) * 60
+    else:
+        sets_per_minute = math.nan
+    return {
+        table.strings[player]: s for player, s in stats.items()
+    }, sets_per_minute
+
+def main():
+    rooms = sys.argv[1:] or listRooms()
+    if not rooms:
+        print('No analytics recorded yet.')
+        return
+    for room in rooms:
+        start = time.perf_counter()
+        table = loadTable(os.path.join(ANALYTICS_DIR, room))
+        per_player, sets_per_minute = summarize(table)
+        elapsed = time.perf_counter() - start
+        print(f'Room {room}: {len(table.time)} rows, {sets_per_minute:.2f} sets / min')
+        print(f'  {"player":<20}{"sets":>6}{"time to set":>13}{"call time":>11}{"dealt":>7}{"undos":>7}')
+        for name, s in sorted(
+            per_player.items(), key=lambda x: x[1].n_sets, reverse=True,
+        ):
+            print(
+                f'  {name[:19]:<20}{s.n_sets:>6}{s.meanTimeToSet():>12.2f}s'
+                f'{s.meanCallTime():>10.2f}s{s.n_dealt:>7}{s.n_undos:>7}'
+            )
+        print(f'  ({elapsed * 1000:.0f} ms)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,971 @@
+#!/usr/bin/env -S uv run
+
+'''
+Micro-benchmarks.
+Usage: `python benchmark.py <name>`. Without a name, lists them.
+'''
+
+from __future__ import annotations
+
+import typing as tp
+import sys
+import io
+import time
+import random
+import asyncio
+import tracemalloc
+from contextlib import redirect_stdout, redirect_stderr
+
+BENCHMARKS: tp.Dict[str, tp.Callable[[], None]] = {}
+
+def benchmark(f: tp.Callable[[], None]):
+    BENCHMARKS[f.__name__] = f
+    return f
+
+def timeIt(f: tp.Callable[[], tp.Any], n: int):
+    start = time.perf_counter()
+    for _ in range(n):
+        f()
+    return (time.perf_counter() - start) / n
+
+def samplePrimitive(n_players: int, n_rows: int, n_cols: int):
+    # Speaks the wire format only, so that it survives model changes.
+    rand = random.Random(0)
+    uuids = [f'player-{i}' for i in range(n_players)]
+    card_ids = [*range(81)]
+    rand.shuffle(card_ids)
+    def smartCard():
+        return dict(
+            card=card_ids.pop(), birth=time.time(),
+            selected_by=rand.sample(uuids, rand.randint(0, min(3, n_players))),
+        )
+    public_zone = [[smartCard() for _ in range(n_cols)] for _ in range(n_rows)]
+    players = [dict(
+        uuid=uuid, name=f'Player {i}', color='10,20,30', voting='IDLE',
+        shouted_set=None, wealth_thickness=rand.randint(0, 30), n_of_wins=0,
+        display_case=[smartCard() if card_ids and rand.random() < .5 else None for _ in range(4)],
+        display_case_hidden=False,
+    ) for i, uuid in enumerate(uuids)]
+    cards_in_deck = format(sum(1 << i for i in card_ids), 'x')
+    return dict(
+        cards_in_deck=cards_in_deck, players=players, public_zone=public_zone,
+    )
+
+@benchmark
+def gamestate():
+    '''
+    Memory footprint and (de)serialization speed of the gamestate model.
+    '''
+    from gamestate import Gamestate
+    from server import UndoTape
+
+    for n_players, n_rows, n_cols in ((4, 3, 4), (12, 4, 7)):
+        primitive = samplePrimitive(n_players, n_rows, n_cols)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        states = [Gamestate.fromPrimitive(primitive) for _ in range(100)]
+        per_state = (tracemalloc.get_traced_memory()[0] - before) / len(states)
+        # The undo tape keeps the state without its indices. 
+        tape = UndoTape(len(states))
+        before = tracemalloc.get_traced_memory()[0]
+        for state in states:
+            tape.recordNewState(state)
+        per_entry = (tracemalloc.get_traced_memory()[0] - before) / len(states)
+        tracemalloc.stop()
+        g = states[0]
+        to_primitive = timeIt(g.toPrimitive, 2000)
+        from_primitive = timeIt(lambda: Gamestate.fromPrimitive(primitive), 2000)
+        print(f'{n_players} players, {n_rows}x{n_cols} zone:')
+        print(f'  memory / gamestate:  {per_state / 1024:8.2f} KB')
+        print(f'  memory / undo entry: {per_entry / 1024:8.2f} KB')
+        print(f'  toPrimitive:         {to_primitive * 1e6:8.1f} us')
+        print(f'  fromPrimitive:       {from_primitive * 1e6:8.1f} us')
+        print(f'  nCardsInDeck:        {timeIt(g.nCardsInDeck, 2000) * 1e6:8.1f} us')
+
+@benchmark
+def deck():
+    '''
+    Set checks and deck encoding size, per deck shape.
+    '''
+    import json
+    from deck import Deck
+
+    for n_attributes, n_values in ((4, 3), (5, 3), (4, 4)):
+        deck = Deck(n_attributes, n_values)
+        rand = random.Random(0)
+        hands = [
+            rand.sample(range(deck.n_cards), n_values) for _ in range(1000)
+        ]
+        cards = [deck.cardOf(i) for i in range(deck.n_cards)]
+        def naive():
+            for hand in hands:
+                all(
+                    len({cards[i][a] for i in hand}) in (1, n_values)
+                    for a in range(n_attributes)
+                )
+        def bitwise():
+            for hand in hands:
+                deck.isSet(hand)
+        mask = format(deck.full_mask, 'x')
+        print(f'{n_attributes} attributes x {n_values} values, {deck.n_cards} cards:')
+        print(f'  isSet, per attribute: {timeIt(naive, 20) / len(hands) * 1e6:6.2f} us')
+        print(f'  isSet, bit-parallel:  {timeIt(bitwise, 20) / len(hands) * 1e6:6.2f} us')
+        print(f'  deck on the wire:     {len(json.dumps(mask)):6d} B')
+
+class Bot:
+    '''
+    A headless client speaking the wire protocol.
+    '''
+    async def connect(self, port: int, table: str | None = None):
+        from shared import (
+            DEFAULT_TABLE, handshakeOf, sendPrimitive, recvPrimitive, recvStream,
+            ServerEventType as SET, ServerEventField as SEF,
+        )
+        handshake = handshakeOf(table or DEFAULT_TABLE)
+        self.reader, self.writer = await asyncio.open_connection('localhost', port)
+        await sendPrimitive(handshake, self.writer)
+        event = await recvPrimitive(self.reader)
+        if event[SEF.TYPE] == SET.REDIRECT:
+            self.writer.close()
+            self.reader, self.writer = await asyncio.open_connection(
+                'localhost', event[SEF.CONTENT], 
+            )
+            await sendPrimitive(handshake, self.writer)
+            event = await recvPrimitive(self.reader)
+        self.uuid = event[SEF.CONTENT]
+        await recvPrimitive(self.reader)    # gamestate
+        await recvStream(self.reader)       # texture
+        self.n_gamestates = 0
+        self.n_popups = 0
+        self.pong = asyncio.Event()
+        self.listener = asyncio.create_task(self.listen())
+        return self
+    
+    async def listen(self):
+        from shared import (
+            recvPrimitive, ServerEventType as SET, ServerEventField as SEF,
+        )
+        try:
+            while True:
+                event = await recvPrimitive(self.reader)
+                type_ = SET(event[SEF.TYPE])
+                if type_ == SET.GAMESTATE:
+                    self.n_gamestates += 1
+                elif type_ == SET.PONG:
+                    self.pong.set()
+                elif type_ == SET.POPUP_MESSAGE:
+                    self.n_popups += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+    
+    async def send(self, event: dict):
+        from shared import sendPrimitive
+        await sendPrimitive(event, self.writer)
+    
+    async def ping(self):
+        # The server answers in order, so the PONG means everything before it is handled.
+        from shared import ClientEventType as CET, ClientEventField as CEF
+        self.pong.clear()
+        await self.send({ CEF.TYPE: CET.PING })
+        await self.pong.wait()
+    
+    async def close(self):
+        self.writer.close()
+        await self.listener
+
+def startServer(port: int, **kw):
+    import gzip
+    from server import Server
+    # The bots flood on purpose. See `ratelimit`.
+    kw.setdefault('rate_limits', None)
+    server = Server(port, analytics=False, **kw)
+    server.texture = gzip.compress(b'')
+    return server, asyncio.create_task(server.start())
+
+@benchmark
+def tick():
+    '''
+    Server throughput under bursty input, with and without broadcast ticking.
+    '''
+    from shared import ClientEventType as CET, ClientEventField as CEF
+
+    N_BOTS = 6
+    N_EVENTS = 200
+
+    async def burst(bot: Bot, rand: random.Random):
+        for _ in range(N_EVENTS):
+            if rand.random() < .1:
+                event = { CEF.TYPE: CET.DEAL_CARD }
+            else:
+                event = {
+                    CEF.TYPE: CET.TOGGLE_SELECT_CARD_PUBLIC,
+                    CEF.TARGET_VALUE: (rand.randrange(3), rand.randrange(4)),
+                }
+            await bot.send(event)
+        await bot.ping()
+
+    async def run(port: int, broadcast_tick: float):
+        server, serving = startServer(port, broadcast_tick=broadcast_tick)
+        await asyncio.sleep(.1)
+        bots = [await Bot().connect(port) for _ in range(N_BOTS)]
+        await asyncio.sleep(.1)
+        for bot in bots:
+            bot.n_gamestates = 0
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            burst(bot, random.Random(i)) for i, bot in enumerate(bots)
+        ])
+        elapsed = time.perf_counter() - start
+        await asyncio.sleep(broadcast_tick + .1)    # let the last tick land
+        n_gamestates = sum(bot.n_gamestates for bot in bots)
+        for bot in bots:
+            await bot.close()
+        serving.cancel()
+        return elapsed, n_gamestates
+
+    n_events = N_BOTS * N_EVENTS
+    print(f'{N_BOTS} clients x {N_EVENTS} events')
+    for i, broadcast_tick in enumerate((0.0, 0.02, 0.05)):
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            elapsed, n_gamestates = asyncio.run(run(23700 + i, broadcast_tick))
+        print(
+            f'  tick {broadcast_tick:4.2f} s: {n_events / elapsed:8.0f} events/s, '
+            f'{n_gamestates:6d} gamestate frames sent',
+        )
+
+@benchmark
+def dispatch():
+    '''
+    Time spent in each event handler, via the server's timing hooks, 
+    and the PING round trip.
+    '''
+    from shared import ClientEventType as CET, ClientEventField as CEF
+
+    N_EVENTS = 500
+    N_PINGS = 500
+
+    async def run(port: int):
+        server, serving = startServer(port)
+        timings: tp.Dict[CET, tp.List[float]] = {}
+        server.timing_hooks.append(
+            lambda type_, dt: timings.setdefault(type_, []).append(dt), 
+        )
+        await asyncio.sleep(.1)
+        bot = await Bot().connect(port)
+        rand = random.Random(0)
+        for _ in range(N_EVENTS):
+            await bot.send(rand.choice((
+                { CEF.TYPE: CET.DEAL_CARD }, 
+                { CEF.TYPE: CET.CALL_SET }, 
+                { CEF.TYPE: CET.CANCEL_CALL_SET }, 
+                { CEF.TYPE: CET.CLEAR_MY_SELECTIONS }, 
+                {
+                    CEF.TYPE: CET.TOGGLE_SELECT_CARD_PUBLIC,
+                    CEF.TARGET_VALUE: (rand.randrange(3), rand.randrange(4)),
+                }, 
+            )))
+        await bot.ping()
+        start = time.perf_counter()
+        for _ in range(N_PINGS):
+            await bot.ping()
+        ping = (time.perf_counter() - start) / N_PINGS
+        await bot.close()
+        serving.cancel()
+        return timings, ping
+
+    with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+        timings, ping = asyncio.run(run(23750))
+    print(f'{"handler":<28}{"calls":>6}{"mean":>10}{"worst":>10}')
+    for type_, dts in sorted(timings.items(), key=lambda x: x[0].value):
+        print(
+            f'{type_.value:<28}{len(dts):>6}'
+            f'{sum(dts) / len(dts) * 1e6:>8.1f}us{max(dts) * 1e6:>8.1f}us', 
+        )
+    print(f'PING round trip: {ping * 1e6:.0f} us')
+
+@benchmark
+def memory():
+    '''
+    The server's memory report, between rounds of dealing and taking.
+    '''
+    from shared import ClientEventType as CET, ClientEventField as CEF
+
+    N_ROUNDS = 4
+    N_EVENTS = 300
+
+    async def run(port: int):
+        server, serving = startServer(port, memory_report=True)
+        await asyncio.sleep(.1)
+        bots = [await Bot().connect(port) for _ in range(4)]
+        rand = random.Random(0)
+        reports = io.StringIO()
+        server.accountant.report(reports)
+        for _ in range(N_ROUNDS):
+            for _ in range(N_EVENTS):
+                await rand.choice(bots).send(rand.choice((
+                    { CEF.TYPE: CET.DEAL_CARD }, 
+                    { CEF.TYPE: CET.TAKE }, 
+                    { CEF.TYPE: CET.CLEAR_MY_SELECTIONS }, 
+                    {
+                        CEF.TYPE: CET.TOGGLE_SELECT_CARD_PUBLIC,
+                        CEF.TARGET_VALUE: (rand.randrange(3), rand.randrange(4)),
+                    }, 
+                )))
+            for bot in bots:
+                await bot.ping()
+            server.accountant.report(reports)
+        for bot in bots:
+            await bot.close()
+        serving.cancel()
+        return reports.getvalue()
+
+    with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+        reports = asyncio.run(run(23760))
+    print(reports, end='')
+    tracemalloc.stop()
+
+@benchmark
+def ratelimit():
+    '''
+    One client floods the table. How the others fare, with and without rate limits.
+    '''
+    from server import RATE_LIMITS
+    from shared import ClientEventType as CET, ClientEventField as CEF
+
+    N_PINGS = 20
+    PING_INTERVAL = .15     # under the 'ping' limit
+
+    async def flood(bot: Bot, sent: tp.List[None]):
+        rand = random.Random(0)
+        while True:
+            await bot.send(rand.choice((
+                { CEF.TYPE: CET.DEAL_CARD }, 
+                {
+                    CEF.TYPE: CET.TOGGLE_SELECT_CARD_PUBLIC,
+                    CEF.TARGET_VALUE: (rand.randrange(3), rand.randrange(4)),
+                }, 
+            )))
+            sent.append(None)
+
+    async def pings(bot: Bot):
+        rtts = []
+        for _ in range(N_PINGS):
+            start = time.perf_counter()
+            await bot.ping()
+            rtts.append(time.perf_counter() - start)
+            await asyncio.sleep(PING_INTERVAL)
+        return sorted(rtts)
+
+    async def run(port: int, rate_limits):
+        server, serving = startServer(port, rate_limits=rate_limits)
+        await asyncio.sleep(.1)
+        flooder, player = [await Bot().connect(port) for _ in range(2)]
+        await asyncio.sleep(.1)
+        player.n_gamestates = 0
+        sent: tp.List[None] = []
+        # With limits, the server stops reading, so the flooder blocks. 
+        flooding = asyncio.create_task(flood(flooder, sent))
+        rtts = await pings(player)
+        flooding.cancel()
+        n_sent = len(sent)
+        n_gamestates = player.n_gamestates
+        n_popups = flooder.n_popups
+        # Its backlog would take the server forever to read. 
+        flooder.writer.transport.abort()
+        await player.close()
+        serving.cancel()
+        return n_sent, rtts, n_gamestates, n_popups
+
+    print(f'1 client floods, another pings {N_PINGS} times meanwhile')
+    for i, (name, rate_limits) in enumerate((
+        ('unlimited', None), ('RATE_LIMITS', RATE_LIMITS), 
+    )):
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            n_sent, rtts, n_gamestates, n_popups = asyncio.run(
+                run(23770 + i, rate_limits), 
+            )
+        print(f'  {name}:')
+        print(f'    events flooded:       {n_sent:8d}')
+        print(f'    PING, median / worst: {rtts[len(rtts) // 2] * 1e3:8.2f} / {rtts[-1] * 1e3:.2f} ms')
+        print(f'    gamestates fanned out to the other client: {n_gamestates}')
+        print(f'    warnings to the flooder: {n_popups}')
+
+@benchmark
+def startup():
+    '''
+    Client startup: texture-first and sequential, vs. gamestate-first and pipelined.
+    '''
+    import os
+    import gzip
+    import tempfile
+    from PIL import Image, ImageDraw
+    from shared import (
+        DEFAULT_TABLE, handshakeOf, sendPrimitive, recvPrimitive, recvStream, PNG,
+    )
+    from env_wrap import CARD_TEXTURE_RESOLUTION
+    from texture import Texture
+    import client
+
+    # a synthetic sheet as large as the real one
+    width, height = CARD_TEXTURE_RESOLUTION[0] * 9, CARD_TEXTURE_RESOLUTION[1] * 9
+    sheet = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(sheet)
+    rand = random.Random(0)
+    for _ in range(2000):
+        x, y = rand.randrange(width), rand.randrange(height)
+        draw.ellipse(
+            (x, y, x + rand.randrange(50, 300), y + rand.randrange(50, 300)), 
+            fill=tuple(rand.randrange(256) for _ in range(3)), 
+        )
+    buf = io.BytesIO()
+    sheet.save(buf, 'PNG')
+    texture = gzip.compress(buf.getvalue())
+
+    async def handshake(port: int):
+        reader, writer = await asyncio.open_connection('localhost', port)
+        await sendPrimitive(handshakeOf(DEFAULT_TABLE), writer)
+        await recvPrimitive(reader)     # YOU_ARE
+        return reader, writer
+
+    async def sequential(port: int):
+        # what the client did before: the texture, fully, then the gamestate
+        start = time.perf_counter()
+        reader, writer = await handshake(port)
+        await recvPrimitive(reader)     # the server sends it first now
+        data = gzip.decompress(await recvStream(reader))
+        Texture(None, Image.open(io.BytesIO(data)))     # type: ignore
+        first_frame = time.perf_counter() - start
+        writer.close()
+        return first_frame, first_frame
+
+    async def pipelined(port: int):
+        start = time.perf_counter()
+        reader, writer = await handshake(port)
+        await recvPrimitive(reader)
+        first_frame = time.perf_counter() - start
+        await client.downloadTexture(reader, None)  # type: ignore
+        texture_ready = time.perf_counter() - start
+        writer.close()
+        return first_frame, texture_ready
+
+    async def run(port: int):
+        server, serving = startServer(port)
+        server.texture = texture
+        await asyncio.sleep(.1)
+        results = [await f(port) for f in (sequential, pipelined)]
+        serving.cancel()
+        return results
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # The decoder caches the PNG. Keep the real one intact.
+        os.chdir(temp_dir)
+        os.makedirs(os.path.dirname(PNG))
+        try:
+            with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                results = asyncio.run(run(23800))
+        finally:
+            os.chdir(cwd)
+    print(f'{width}x{height} sheet, {len(texture) / 1024 / 1024:.1f} MB:')
+    for name, (first_frame, texture_ready) in zip(
+        ('sequential', 'pipelined'), results, 
+    ):
+        print(f'  {name}:')
+        print(f'    first frame:   {first_frame   * 1e3:8.1f} ms')
+        print(f'    texture ready: {texture_ready * 1e3:8.1f} ms')
+
+def probedServer(port: int, encode_executor, conn):
+    # Runs in its own process, so that the bots don't stall its loop.
+    async def probe(stalls: tp.List[float]):
+        # how late a 1 ms sleep wakes up, i.e., how long the loop was blocked
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(.001)
+            stalls.append(time.perf_counter() - start - .001)
+
+    async def main():
+        _, serving = startServer(port, encode_executor=encode_executor)
+        stalls: tp.List[float] = []
+        prober = asyncio.create_task(probe(stalls))
+        await asyncio.to_thread(conn.recv)  # the table is set
+        stalls.clear()
+        await asyncio.to_thread(conn.recv)  # the burst is over
+        prober.cancel()
+        conn.send(sorted(stalls))
+        await asyncio.to_thread(conn.recv)  # the bots left
+        serving.cancel()
+        try:
+            await serving
+        except asyncio.CancelledError:
+            pass
+
+    with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+        asyncio.run(main())
+
+@benchmark
+def encode():
+    '''
+    Server event-loop stalls with a large gamestate, per encode executor.
+    '''
+    import multiprocessing
+    from shared import ClientEventType as CET, ClientEventField as CEF
+
+    N_BOTS = 8
+    N_EVENTS = 100
+    N_ROWS, N_COLS = 9, 9
+
+    async def burst(bot: Bot, rand: random.Random):
+        for _ in range(N_EVENTS):
+            await bot.send({
+                CEF.TYPE: CET.TOGGLE_SELECT_CARD_PUBLIC,
+                CEF.TARGET_VALUE: (rand.randrange(N_ROWS), rand.randrange(N_COLS)),
+            })
+        await bot.ping()
+
+    async def run(port: int, conn):
+        await asyncio.sleep(.5)
+        bots = [await Bot().connect(port) for _ in range(N_BOTS)]
+        await bots[0].send({
+            CEF.TYPE: CET.ACC_PUBLIC_ZONE_SHAPE, 
+            CEF.TARGET_VALUE: (N_ROWS - 3, N_COLS - 4), 
+        })
+        await bots[0].send({ CEF.TYPE: CET.DEAL_TO_FILL })
+        await bots[0].ping()
+        conn.send('set')
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            burst(bot, random.Random(i)) for i, bot in enumerate(bots)
+        ])
+        elapsed = time.perf_counter() - start
+        conn.send('over')
+        stalls = await asyncio.to_thread(conn.recv)
+        for bot in bots:
+            await bot.close()
+        await asyncio.sleep(.1)
+        conn.send('left')
+        return elapsed, stalls
+
+    n_events = N_BOTS * N_EVENTS
+    print(f'{N_BOTS} clients x {N_EVENTS} events, {N_ROWS}x{N_COLS} zone')
+    for i, encode_executor in enumerate((None, 'thread', 'process')):
+        port = 23900 + i
+        conn, child_conn = multiprocessing.Pipe()
+        server = multiprocessing.Process(
+            target=probedServer, args=(port, encode_executor, child_conn), 
+        )
+        server.start()
+        with redirect_stderr(io.StringIO()):    # download bars
+            elapsed, stalls = asyncio.run(run(port, conn))
+        server.join()
+        print(
+            f'  {str(encode_executor):>7}: {n_events / elapsed:6.0f} events/s, '
+            f'loop stall median {stalls[len(stalls) // 2] * 1e3:5.2f} ms, '
+            f'99% {stalls[len(stalls) * 99 // 100] * 1e3:5.2f} ms, '
+            f'worst {stalls[-1] * 1e3:6.2f} ms',
+        )
+
+@benchmark
+def send():
+    '''
+    Client sends under a click burst: one task per frame vs. the 
+    queue-fed `sender`, which coalesces frames into one write and drain.
+    '''
+    import socket
+    from shared import sendPrimitive, ClientEventType as CET, ClientEventField as CEF
+    import client
+
+    N_FRAMES = 10000
+    event = {
+        CEF.TYPE: CET.TOGGLE_SELECT_CARD_PUBLIC, CEF.TARGET_VALUE: (1, 2), 
+    }
+
+    async def sink(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # a slow link: about 400 KB/s
+        while await reader.read(4096):
+            await asyncio.sleep(.01)
+        writer.close()
+
+    async def run(port: int, coalesce: bool):
+        # Small kernel buffers, or they would soak up the whole burst. 
+        listener = socket.socket()
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        listener.bind(('localhost', port))
+        server = await asyncio.start_server(sink, sock=listener)
+        _, writer = await asyncio.open_connection('localhost', port)
+        writer.get_extra_info('socket').setsockopt(
+            socket.SOL_SOCKET, socket.SO_SNDBUF, 4096, 
+        )
+        n_drains = 0
+        start = time.perf_counter()
+        if coalesce:
+            outgoing: asyncio.Queue[tp.Dict] = asyncio.Queue()
+            done = asyncio.Event()
+            n_sent = 0
+            def onSent(n_frames: int):
+                nonlocal n_drains, n_sent
+                n_drains += 1
+                n_sent += n_frames
+                if n_sent == N_FRAMES:
+                    done.set()
+            task = asyncio.create_task(client.sender(writer, outgoing, onSent))
+            for _ in range(N_FRAMES):
+                outgoing.put_nowait(event)
+                await asyncio.sleep(0)
+            queued = time.perf_counter() - start
+            await done.wait()
+            task.cancel()
+        else:
+            tasks = []
+            for _ in range(N_FRAMES):
+                tasks.append(asyncio.create_task(sendPrimitive(event, writer)))
+                await asyncio.sleep(0)
+            queued = time.perf_counter() - start
+            await asyncio.gather(*tasks)
+            n_drains = N_FRAMES
+        elapsed = time.perf_counter() - start
+        writer.close()
+        await writer.wait_closed()
+        server.close()
+        await server.wait_closed()
+        return queued, elapsed, n_drains
+
+    print(f'{N_FRAMES} frames, queued as fast as possible, over a slow link:')
+    for i, (name, coalesce) in enumerate((('task / frame', False), ('sender', True))):
+        queued, elapsed, n_drains = asyncio.run(run(23850 + i, coalesce))
+        print(
+            f'  {name:>12}: queued in {queued * 1e3:7.1f} ms, '
+            f'sent in {elapsed * 1e3:7.1f} ms, {n_drains:5d} drains', 
+        )
+
+def supervisedServer(port: int, n_workers: int, conn):
+    # Runs in its own process, which spawns the workers.
+    import os
+    from supervisor import Supervisor
+
+    # The workers inherit the file descriptors, not `sys.stdout`.
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+
+    async def main():
+        serving = asyncio.create_task(
+            Supervisor(port, n_workers, analytics=False, rate_limits=None).start(), 
+        )
+        await asyncio.to_thread(conn.recv)  # the load is over
+        serving.cancel()
+        await serving
+
+    with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+        asyncio.run(main())
+
+def tableLoad(port: int, table: str, n_bots: int, n_events: int, conn):
+    # The players of one table, in their own process, so that the 
+    # clients don't become the bottleneck. 
+    from shared import ClientEventType as CET, ClientEventField as CEF
+
+    async def connect():
+        # The workers may still be starting up.
+        for _ in range(100):
+            try:
+                return await Bot().connect(port, table)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await asyncio.sleep(.1)
+        return await Bot().connect(port, table)
+
+    async def burst(bot: Bot, rand: random.Random):
+        for _ in range(n_events):
+            if rand.random() < .1:
+                event = { CEF.TYPE: CET.DEAL_CARD }
+            else:
+                event = {
+                    CEF.TYPE: CET.TOGGLE_SELECT_CARD_PUBLIC,
+                    CEF.TARGET_VALUE: (rand.randrange(3), rand.randrange(4)),
+                }
+            await bot.send(event)
+        await bot.ping()
+
+    async def main():
+        bots = [await connect() for _ in range(n_bots)]
+        conn.send('ready')
+        start_at = await asyncio.to_thread(conn.recv)
+        await asyncio.sleep(max(0, start_at - time.time()))
+        start = time.time()
+        await asyncio.gather(*[
+            burst(bot, random.Random(i)) for i, bot in enumerate(bots)
+        ])
+        end = time.time()
+        for bot in bots:
+            await bot.close()
+        conn.send((start, end))
+
+    with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+        asyncio.run(main())
+
+@benchmark
+def scaling():
+    '''
+    Supervisor throughput on loopback, by number of worker processes.
+    '''
+    import os
+    import multiprocessing
+    from supervisor import ownerOf
+
+    N_TABLES = 8
+    N_BOTS = 2      # per table
+    N_EVENTS = 300  # per bot
+    context = multiprocessing.get_context('spawn')
+
+    def tablesFor(n_workers: int):
+        # As many tables on each worker, to measure the scaling, not the hash.
+        tables: tp.List[str] = []
+        i = 0
+        while len(tables) < N_TABLES:
+            table = f'table-{i}'
+            owner = ownerOf(table, n_workers)
+            if sum(ownerOf(t, n_workers) == owner for t in tables) < N_TABLES // n_workers:
+                tables.append(table)
+            i += 1
+        return tables
+
+    n_events = N_TABLES * N_BOTS * N_EVENTS
+    print(f'{os.cpu_count()} cores, {N_TABLES} tables x {N_BOTS} clients x {N_EVENTS} events')
+    baseline = None
+    for i, n_workers in enumerate((1, 2, 4)):
+        port = 23900 + i * 10
+        server_conn, child_conn = context.Pipe()
+        server = context.Process(
+            target=supervisedServer, args=(port, n_workers, child_conn), 
+        )
+        server.start()
+        loads = []
+        for table in tablesFor(n_workers):
+            conn, child_conn = context.Pipe()
+            load = context.Process(
+                target=tableLoad, 
+                args=(port, table, N_BOTS, N_EVENTS, child_conn), 
+            )
+            load.start()
+            loads.append((load, conn))
+        for _, conn in loads:
+            conn.recv()     # ready
+        start_at = time.time() + .5
+        for _, conn in loads:
+            conn.send(start_at)
+        spans = [conn.recv() for _, conn in loads]
+        elapsed = max(end for _, end in spans) - min(start for start, _ in spans)
+        for load, _ in loads:
+            load.join()
+        server_conn.send('done')
+        server.join()
+        throughput = n_events / elapsed
+        baseline = baseline or throughput
+        print(
+            f'  {n_workers} workers: {throughput:8.0f} events/s '
+            f'({throughput / baseline:.2f}x)', 
+        )
+
+@benchmark
+def wakeup():
+    '''
+    Delay from the network thread posting an event to the Tk loop running 
+    it: polling at FPS vs. a `Waker`. Uses a bare Tcl interpreter, so 
+    no display is needed.
+    '''
+    import queue
+    import tkinter as tk
+    from client_utils import Waker, NetworkThread
+    from env_wrap import FPS
+
+    N_EVENTS = 200
+
+    def run(is_polling: bool):
+        tcl = tk.Tcl()
+        inbox: queue.SimpleQueue[float] = queue.SimpleQueue()
+        delays: tp.List[float] = []
+        def process():
+            while True:
+                try:
+                    delays.append(time.perf_counter() - inbox.get_nowait())
+                except queue.Empty:
+                    return
+        if is_polling:
+            def poll():
+                process()
+                tcl.after(round(1000 / FPS), poll)
+            poll()
+            wake = lambda: None
+        else:
+            waker = Waker(tcl, process, 1 / FPS)
+            wake = waker.wake
+        async def produce():
+            rand = random.Random(0)
+            for _ in range(N_EVENTS):
+                await asyncio.sleep(rand.random() * .01)
+                inbox.put(time.perf_counter())
+                wake()
+        network = NetworkThread()
+        network.spawn(produce())
+        # `mainloop` returns at once without windows. This is its body. 
+        while len(delays) < N_EVENTS:
+            tcl.tk.dooneevent()
+        network.close()
+        if not is_polling:
+            waker.close()
+        return sorted(delays)
+
+    print(f'{N_EVENTS} events, {FPS} FPS:')
+    for name, is_polling in (('poll', True), ('waker', False)):
+        delays = run(is_polling)
+        print(
+            f'  {name:>5}: median {delays[len(delays) // 2] * 1e3:6.2f} ms, '
+            f'worst {delays[-1] * 1e3:6.2f} ms', 
+        )
+
+@benchmark
+def renderer():
+    '''
+    Public zone rendering: one widget per card vs. a single canvas. Needs a display.
+    '''
+    import tkinter as tk
+    from gamestate import Gamestate
+    from texture import Texture
+    import client
+
+    N_ROWS, N_COLS = 8, 10
+    N_REPEATS = 20
+    try:
+        gamestate = Gamestate.fromPrimitive(samplePrimitive(1, N_ROWS, N_COLS))
+        root = client.Root(
+            None, None, 'player-0', gamestate, 0,   # type: ignore
+        )
+    except tk.TclError as e:
+        print('No display:', e)
+        return
+    root.onTextureReady(Texture(root))
+    cards = [*gamestate.AllSmartCards()]
+
+    def clock(f: tp.Callable[[], None]):
+        start = time.perf_counter()
+        f()
+        root.update()
+        return time.perf_counter() - start
+
+    print(f'{N_ROWS}x{N_COLS} public zone:')
+    for cls in (client.PublicZone, client.CanvasPublicZone):
+        window = tk.Toplevel(root)
+        zone = cls(root, window)
+        build = clock(zone.refresh)
+        def select():
+            for card in random.sample(cards, 10):
+                gamestate.toggleSelection(card, 'player-0')
+            zone.refresh()
+        refresh = sum(clock(select) for _ in range(N_REPEATS)) / N_REPEATS
+        animate = sum(clock(zone.animate) for _ in range(N_REPEATS)) / N_REPEATS
+        gamestate.public_zone.append([None] * N_COLS)
+        reshape = clock(zone.refresh)
+        gamestate.public_zone.pop()
+        zone.refresh()
+        window.destroy()
+        print(f'  {cls.__name__}:')
+        print(f'    build:   {build   * 1e3:8.1f} ms')
+        print(f'    refresh: {refresh * 1e3:8.1f} ms')
+        print(f'    animate: {animate * 1e3:8.1f} ms')
+        print(f'    reshape: {reshape * 1e3:8.1f} ms')
+    root.destroy()
+
+@benchmark
+def analytics():
+    '''
+    Appending to, and querying, the columnar analytics store.
+    '''
+    import tempfile
+    import analytics
+    from analytics import AnalyticsWriter, Kind
+
+    N_ROWS = 1_000_000
+    rand = random.Random(0)
+    names = [f'Player {i}' for i in range(12)]
+    kinds = [*Kind]
+    with tempfile.TemporaryDirectory() as root_dir:
+        writer = AnalyticsWriter('bench', root_dir)
+        start = time.perf_counter()
+        for _ in range(N_ROWS):
+            writer.record(rand.choice(kinds), rand.choice(names), rand.random() * 30)
+            if writer.isDue():
+                writer.flush()
+        writer.flush()
+        record = (time.perf_counter() - start) / N_ROWS
+        start = time.perf_counter()
+        table = analytics.loadTable(writer.dir)
+        load = time.perf_counter() - start
+        start = time.perf_counter()
+        analytics.summarize(table)
+        summarize = time.perf_counter() - start
+    print(f'{N_ROWS} rows:')
+    print(f'  record:    {record * 1e6:8.2f} us / row')
+    print(f'  load:      {load * 1e3:8.1f} ms')
+    print(f'  summarize: {summarize * 1e3:8.1f} ms')
+
+# entry point -> modules it must not load at import
+IMPORT_BUDGETS = {
+    'server': ('PIL', 'tkinter', 'tqdm', 'cairosvg'),
+    'client': ('PIL', 'tqdm', 'cairosvg'),
+    'rasterize': ('PIL', 'tkinter', 'tqdm', 'asyncio'),
+}
+
+@benchmark
+def imports():
+    '''
+    Cold-start import cost of each entry point, from `python -X importtime`.
+    '''
+    import os
+    import subprocess
+
+    N_RUNS = 5
+    N_TOP = 6
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def importTime(module: str):
+        # {top-level package: self time in us}, and the total
+        stderr = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'], 
+            cwd=here, capture_output=True, text=True, check=True, 
+        ).stderr
+        packages: tp.Dict[str, int] = {}
+        total = 0
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            name = name.strip()
+            top = name.split('.')[0]
+            packages[top] = packages.get(top, 0) + int(self_us)
+            if name == module:
+                total = int(cumulative_us)
+        return total, packages
+
+    for module, unwanted in IMPORT_BUDGETS.items():
+        total, packages = min(
+            (importTime(module) for _ in range(N_RUNS)), key=lambda x: x[0], 
+        )
+        print(f'{module}: {total / 1e3:6.1f} ms')
+        for name, self_us in sorted(
+            packages.items(), key=lambda x: x[1], reverse=True, 
+        )[:N_TOP]:
+            print(f'    {name:<24}{self_us / 1e3:6.1f} ms')
+        loaded = [name for name in unwanted if name in packages]
+        if loaded:
+            print('  Warning: loads', ', '.join(loaded))
+
+def main():
+    try:
+        name = sys.argv[1]
+    except IndexError:
+        print('Benchmarks:')
+        for name, f in BENCHMARKS.items():
+            print(' ', name, '-', (f.__doc__ or '').strip())
+        return
+    BENCHMARKS[name]()
+
+if __name__ == '__main__':
+    main()
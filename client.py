@@ -6,10 +6,10 @@ import os
 import typing as tp
 import asyncio
 from asyncio import StreamReader, StreamWriter
-from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from abc import ABC, abstractmethod
 import math
-import gzip
+import queue
 
 import tkinter as tk
 from tkinter import ttk, font
@@ -24,32 +24,53 @@ from shared import (
 )
 from env_wrap import *
 from gamestate import *
-from texture import Texture
+from texture import Texture, TextureDecoder, ZOOM_LADDER, DEFAULT_ZOOM_STEP
 from client_utils import *
+from prediction import Predictor, PREDICTED_SHOUT
 
 HEAT_LASTS_FOR = 1 # sec
+PLACEHOLDER_COLOR = 'light gray'  # a card whose texture has not arrived yet
 UNDO_ALLOWED_AFTER = 1 # sec
+FRESH_MESSAGE_LASTS_FOR = 3 # sec
+MESSAGE_LOG_KEEP = 200 # lines
+TEXTURE_FEED_SIZE = 64 * 1024 # bytes handed to the texture decoder at once
+# After a change, animations are ticked at FPS for this long, then the 
+# mainloop sleeps until the next event. Slack for server clock skew. 
+ANIMATIONS_LAST_FOR = max(HEAT_LASTS_FOR, UNDO_ALLOWED_AFTER, FRESH_MESSAGE_LASTS_FOR) + 1 # sec
+
+def isVersioned(event: tp.Dict):
+    # These are checked against the gamestate version they were based on.
+    type_ = CET(event[CEF.TYPE])
+    return type_ in (CET.TAKE, CET.UNDO) or (
+        type_ == CET.VOTE and event[CEF.VOTE] == Vote.ACCEPT
+    )
 
 BOLD_STYLE = 'Bold.TLabel'
 SMALL_STYLE = 'small.TLabel'
 
-@asynccontextmanager
-async def Network():
+async def connect():
     last_url = loadConfig().get('last_url', None)
     if last_url is not None:
         print(f'Press Enter to connect to: {last_url}')
-    url = input('Server (ip_addr:port) > ').strip()
+    url = input('Server (ip_addr:port[/table]) > ').strip()
     if url:
         writeConfig('last_url', url)
     else:
         assert last_url is not None
         url = last_url
+    url, _, table = url.partition('/')
+    if table and not TABLE_NAME.fullmatch(table):
+        print(f'Invalid table name {table!r}: use up to 32 letters, digits, "_" or "-".')
+        raise ValueError(table)
     try:
         host, port_str = url.split(':')
     except ValueError:
         host = 'localhost'
         port_str = url
-    port = int(port_str)
+    reader, writer = await openConnection(host, int(port_str))
+    return reader, writer, table or DEFAULT_TABLE
+
+async def openConnection(host: str, port: int):
     print(f'Connecting to {host}:{port}...')
     try:
         reader, writer = await asyncio.open_connection(host, port)
@@ -59,132 +80,326 @@ async def Network():
         input('Press Enter to view exception')
         raise
     print('ok')
-    try:
-        yield reader, writer
-    finally:
-        print('closing...')
-        writer.close()
-        await writer.wait_closed()
-        print('ok')
+    return reader, writer
 
-async def receiver(reader: StreamReader, queue: asyncio.Queue[tp.Dict | None]):
+async def disconnect(writer: StreamWriter):
+    print('closing...')
+    writer.close()
     try:
-        while True:
-            try:
-                event = await recvPrimitive(reader)
-            except (
-                asyncio.IncompleteReadError, 
-                BrokenPipeError,
-                ConnectionAbortedError, ConnectionResetError, 
-                TimeoutError, 
-            ):
-                break
-            await queue.put(event)
-        await queue.put(None)
-    except asyncio.CancelledError:
+        await writer.wait_closed()
+    except (ConnectionResetError, BrokenPipeError):
         pass
+    print('ok')
+
+def decodeEvent(payload: bytes):
+    # Runs in the decoder thread. 
+    event = payloadToPrimitive(payload)
+    if SET(event[SEF.TYPE]) == SET.GAMESTATE:
+        event[SEF.CONTENT] = Gamestate.fromPrimitive(event[SEF.CONTENT])
+    return event
+
+async def receiver(
+    reader: StreamReader, deliver: tp.Callable[[tp.Dict | None], None], 
+):
+    '''
+    Reads frames on the event loop and decodes them in a worker thread, 
+    so the UI only ever sees ready-to-render gamestates.  
+    Decoding of one frame overlaps with reading the next one.  
+    `deliver` gets each decoded event in order, then None.  
+    '''
+    loop = asyncio.get_running_loop()
+    # one worker keeps the events in order
+    with ThreadPoolExecutor(1, thread_name_prefix='decoder') as executor:
+        decoded: asyncio.Queue[asyncio.Future | None] = asyncio.Queue()
+
+        async def forward():
+            while True:
+                future = await decoded.get()
+                if future is None:
+                    deliver(None)
+                    return
+                deliver(await future)
+
+        forwarder = asyncio.create_task(forward())
+        try:
+            while True:
+                try:
+                    payload = await recvPayload(reader)
+                except (
+                    asyncio.IncompleteReadError, 
+                    BrokenPipeError,
+                    ConnectionAbortedError, ConnectionResetError, 
+                    TimeoutError, 
+                ):
+                    break
+                await decoded.put(loop.run_in_executor(
+                    executor, decodeEvent, payload, 
+                ))
+            await decoded.put(None)
+            await forwarder
+        except asyncio.CancelledError:
+            forwarder.cancel()
+
+async def sender(
+    writer: StreamWriter, outgoing: asyncio.Queue[tp.Dict], 
+    onSent: tp.Callable[[int], None], 
+):
+    '''
+    The only task that writes to the server. Frames that queue up while 
+    a drain is pending go out together, in one write and one drain.  
+    `onSent` gets how many frames were drained.  
+    '''
+    while True:
+        events = [await outgoing.get()]
+        while not outgoing.empty():
+            events.append(outgoing.get_nowait())
+        buf = bytearray()
+        for event in events:
+            payload = primitiveToPayload(event)
+            buf += prefixOf(len(payload))
+            buf += payload
+        writer.write(buf)
+        try:
+            await writer.drain()
+        except (
+            BrokenPipeError, 
+            ConnectionAbortedError, ConnectionResetError, 
+            TimeoutError, 
+        ):
+            return  # the receiver reports the disconnection
+        onSent(len(events))
+
+async def downloadTexture(reader: StreamReader, root: Root):
+    '''
+    Decodes the texture in a worker thread while it downloads, and cuts 
+    it into sprites there too.  
+    '''
+    loop = asyncio.get_running_loop()
+    decoder = TextureDecoder()
+    # one worker keeps the chunks in order
+    with ThreadPoolExecutor(1, thread_name_prefix='texture') as executor:
+        feeding: tp.List[asyncio.Future] = []
+        batch = bytearray()
+        async for chunk in iterStream(reader):
+            batch += chunk
+            if len(batch) >= TEXTURE_FEED_SIZE:
+                feeding.append(loop.run_in_executor(executor, decoder.feed, bytes(batch)))
+                batch.clear()
+        feeding.append(loop.run_in_executor(executor, decoder.feed, bytes(batch)))
+        await asyncio.gather(*feeding)
+        return await loop.run_in_executor(executor, decoder.close, root)
 
 class Root(tk.Tk):
     def __init__(
-        self, queue: asyncio.Queue[tp.Dict | None], writer: StreamWriter, 
-        uuid: str, gamestate: Gamestate,
+        self, network: NetworkThread, writer: StreamWriter, 
+        uuid: str, gamestate: Gamestate, version: int, 
+        startupTimer: StartupTimer | None = None, 
     ):
         super().__init__()
-        self.queue = queue
+        self.network = network
         self.writer = writer
         self.uuid = uuid
         self.gamestate = gamestate
+        self.version = version
+        self.predictor = Predictor(uuid, gamestate)
         self.is_closed = False
         self.last_info_change = 0
         self.serverClock = ServerClock()
         self.pinger = Pinger(lambda: self.submit({ CEF.TYPE: CET.PING }))
-        self.submitters: tp.List[asyncio.Task] = []
+        self.outbox: tp.List[tp.Dict] = []
+        # consumed by `sender` in the network thread
+        self.outgoing: asyncio.Queue[tp.Dict] = asyncio.Queue()
+        self.n_unsent = 0   # frames handed to `sender` and not drained yet
         self.last_undo_uuid: str = 'has not received any undo uuid since start'
-        self.dialogQueue: tp.List[tp.Coroutine] = []
-        self.dialogLock = asyncio.Lock()
+        # Calls from the network thread, run on the Tk thread. 
+        self.inbox: queue.SimpleQueue[tp.Tuple[tp.Callable, tp.Tuple]] = queue.SimpleQueue()
+        self.waker = Waker(self, self.processInbox, 1 / FPS)
+        self.dialogQueue: tp.List[tp.Callable[[], None]] = []
+        self.is_dialog_open = False
+        self.animate_until = 0.0
+        self.ticker: str | None = None
         self.undo_uuids_seen = set()
         self.last_undo_by_others = 0.0
+        self.zoom_step = DEFAULT_ZOOM_STEP
+        # Cards are drawn as placeholders until the texture arrives. 
+        self.texture: Texture | None = None
+        self.startupTimer = startupTimer or StartupTimer()
+        self.debugRecorder = DebugRecorder(
+            f'./logs/{uuid}.txt', 
+            DEBUG_SNAPSHOT_KEEP, DEBUG_SNAPSHOT_INTERVAL, 
+        ) if DEBUG_SNAPSHOT_ENABLED else None
 
         self.setup()
     
-    async def asyncMainloop(self):
-        def onClose():
-            self.is_closed = True
-        self.protocol("WM_DELETE_WINDOW", onClose)
+    def run(self):
+        '''
+        Tk's own mainloop. It sleeps until user input, a `Waker` wakeup 
+        from the network thread, or the next animation tick.  
+        '''
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.update()
+        self.startupTimer.reach('first frame')
+        self.tick()
+        self.mainloop()
+    
+    def close(self):
+        self.is_closed = True
+        self.quit()
+    
+    def tick(self):
+        self.animate()
+        self.pinger.poll()
+        if time.time() < self.animate_until:
+            delay = 1 / FPS
+        else:
+            # Nothing moves. Only the pinger needs waking up. 
+            delay = self.pinger.interval
+        self.ticker = self.after(round(delay * 1000), self.tick)
+    
+    def keepAnimating(self):
+        was_idle = time.time() >= self.animate_until
+        self.animate_until = time.time() + ANIMATIONS_LAST_FOR
+        if was_idle and self.ticker is not None:
+            self.after_cancel(self.ticker)
+            self.ticker = self.after_idle(self.tick)
+    
+    def callSoonThreadsafe(self, f: tp.Callable, *args):
+        self.inbox.put((f, args))
+        self.waker.wake()
+    
+    def processInbox(self):
         while not self.is_closed:
-            # print('processQueue...')
-            self.processQueue()
-            # print('ok')
-            self.animate()
-            # print('update GUI...')
-            self.update()
-            next_update_time = time.time() + 1 / FPS
-            self.pinger.poll()
-            await self.processDialogQueue()
-            # print('processQueue...')
-            self.processQueue()
-            # print('ok')
-            await asyncio.gather(*self.submitters)
-            self.submitters.clear()
-            # print('idle...')
-            await asyncio.sleep(max(0.001, next_update_time - time.time()))
-            # print('ok')
-    
-    async def processDialogQueue(self):
+            try:
+                f, args = self.inbox.get_nowait()
+            except queue.Empty:
+                return
+            f(*args)
+    
+    def openDialog(self, f: tp.Callable[[], None]):
+        # A dialog runs a nested Tk loop, in which another may be opened.
+        self.dialogQueue.append(f)
+        if self.is_dialog_open:
+            return
+        self.is_dialog_open = True
         try:
-            f = self.dialogQueue.pop(0)
-        except IndexError:
+            while self.dialogQueue:
+                self.dialogQueue.pop(0)()
+        finally:
+            self.is_dialog_open = False
+    
+    def onServerEvent(self, event: tp.Dict | None):
+        if event is None:
+            self.onUnexpectedDisconnect()
             return
-        await f
-    
-    def processQueue(self):
-        while not self.queue.empty():
-            event = self.queue.get_nowait()
-            if event is None:
-                self.onUnexpectedDisconnect()
-                break
-            type_ = SET(event[SEF.TYPE])
-            if type_ == SET.GAMESTATE:
-                self.onUpdateGamestate(Gamestate.fromPrimitive(event[SEF.CONTENT]))
-                new_undo_uuid = event[SEF.LAST_UNDO_UUID]
-                if new_undo_uuid != self.last_undo_uuid:
-                    self.last_undo_uuid = new_undo_uuid
-                    if new_undo_uuid in self.undo_uuids_seen:
-                        self.last_undo_by_others = time.time()
-                    self.undo_uuids_seen.add(new_undo_uuid)
-            elif type_ == SET.YOU_ARE:
-                assert False
-            elif type_ == SET.POPUP_MESSAGE:
-                title, msg = event[SEF.CONTENT]
-                print('>>>>>> Message from server')
-                print(title)
-                print(msg)
-                print('<<<<<<')
-                async def f():
-                    async with self.dialogLock:
-                        messagebox.showinfo(title, msg)
-                self.dialogQueue.append(f())
-            elif type_ == SET.PONG:
-                rtl = self.pinger.onPong()
-                self.leftPanel.selfConfigBar.labelPing.config(
-                    text=f'PING: {round(rtl * 1000)} ms', 
-                )
-            else:
-                raise ValueError(f'Unexpected event type: {type_}')
+        type_ = SET(event[SEF.TYPE])
+        if type_ == SET.GAMESTATE:
+            if event[SEF.VERSION] < self.version:
+                print('Dropping a stale gamestate, version', event[SEF.VERSION])
+                return
+            self.version = event[SEF.VERSION]
+            self.onUpdateGamestate(
+                event[SEF.CONTENT], event[SEF.ACKS].get(self.uuid, 0), 
+            )
+            new_undo_uuid = event[SEF.LAST_UNDO_UUID]
+            if new_undo_uuid != self.last_undo_uuid:
+                self.last_undo_uuid = new_undo_uuid
+                if new_undo_uuid in self.undo_uuids_seen:
+                    self.last_undo_by_others = time.time()
+                self.undo_uuids_seen.add(new_undo_uuid)
+        elif type_ == SET.YOU_ARE:
+            assert False
+        elif type_ == SET.POPUP_MESSAGE:
+            title, msg = event[SEF.CONTENT]
+            print('>>>>>> Message from server')
+            print(title)
+            print(msg)
+            print('<<<<<<')
+            self.messageLog.post(title, msg)
+            self.keepAnimating()
+        elif type_ == SET.PONG:
+            rtl = self.pinger.onPong()
+            self.leftPanel.selfConfigBar.labelPing.config(
+                text=f'PING: {round(rtl * 1000)} ms', 
+            )
+        else:
+            raise ValueError(f'Unexpected event type: {type_}')
     
     def submit(self, event: tp.Dict):
-        event[CEF.HASH] = self.gamestate.mutableHash()
-        co = sendPrimitive(event, self.writer)
-        task = asyncio.create_task(co)
-        self.submitters.append(task)
+        if isVersioned(event):
+            event[CEF.BASE_VERSION] = self.version
+        if not self.outbox:
+            self.after_idle(self.flushOutbox)
+        self.outbox.append(event)
+        if self.predictor.submit(event):
+            self.gamestate = self.predictor.predicted
+            self.refresh()
+    
+    def flushOutbox(self):
+        # Everything submitted before Tk goes idle goes out as one frame.
+        if not self.outbox:
+            return
+        if len(self.outbox) == 1:
+            event = self.outbox[0]
+        else:
+            event = { CEF.TYPE: CET.BATCH, CEF.EVENTS: self.outbox }
+        self.outbox = []
+        self.n_unsent += 1
+        self.network.loop.call_soon_threadsafe(self.outgoing.put_nowait, event)
+        self.refreshBacklog()
+    
+    def onSent(self, n_frames: int):
+        self.n_unsent -= n_frames
+        self.refreshBacklog()
+    
+    def refreshBacklog(self):
+        # Only shows when the connection can't keep up. 
+        label = self.leftPanel.selfConfigBar.labelBacklog
+        text = f'SENDING: {self.n_unsent}' if self.n_unsent > 1 else ''
+        if label.cget('text') != text:
+            label.config(text=text)
     
     def setup(self):
-        self.texture = Texture(self)
         self.title('Web Set')
         style = ttk.Style()
         style.theme_use('clam')
+        self.textFont = font.Font(family=FONT)
+        self.boldTextFont = font.Font(family=FONT, weight=font.BOLD)
+        self.applyStyles()
+        self.option_add("*TSpinbox.Font", "TkDefaultFont")  # style.configure doesn't work for Spinbox
+        for key in ('plus', 'equal', 'KP_Add'):
+            self.bind(f'<Control-{key}>', lambda _: self.zoomTo(self.zoom_step + 1))
+        for key in ('minus', 'KP_Subtract'):
+            self.bind(f'<Control-{key}>', lambda _: self.zoomTo(self.zoom_step - 1))
+        self.bind('<Control-0>', lambda _: self.zoomTo(DEFAULT_ZOOM_STEP))
+
+        self.bottomPanel = BottomPanel(self, self)
+        self.messageLog = MessageLog(self, self)
+        upperBody = ttk.Frame(self)
+        upperBody.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.leftPanel = LeftPanel(self, upperBody)
+        self.leftPanel.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        rightBody = ttk.Frame(upperBody)
+        rightBody.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
+        self.publicZoneTopPanel = PublicZoneTopPanel(self, rightBody)
+        if PUBLIC_ZONE_RENDERER == 'canvas':
+            self.publicZone = CanvasPublicZone(self, rightBody)
+        else:
+            self.publicZone = PublicZone(self, rightBody)
+        self.refresh()
+        self.after(100, self.freezeSize)
+    
+    def freezeSize(self):
+        self.geometry(f'{self.winfo_width()}x{self.winfo_height()}')
+    
+    def px(self, size: float):
+        # Sizes in env.py are at zoom 1.0.
+        return round(size * ZOOM_LADDER[self.zoom_step])
+    
+    def applyStyles(self):
+        font_size = self.px(FONT_SIZE)
+        style = ttk.Style()
         padding = (
-            round(FONT_SIZE * 0.5), round(FONT_SIZE * 0.1), 
+            round(font_size * 0.5), round(font_size * 0.1), 
         )
         for style_name in (
             'TLabel', 'TButton', 'TSpinbox',
@@ -192,67 +407,76 @@ class Root(tk.Tk):
             style.configure(
                 style_name, 
                 padding=padding,
-                font=(FONT, FONT_SIZE),
+                font=(FONT, font_size),
             )
         defaultFont = font.nametofont("TkDefaultFont")
-        defaultFont.configure(size=FONT_SIZE)
-        self.option_add("*TSpinbox.Font", defaultFont)  # style.configure doesn't work for Spinbox
-        style.configure('TSpinbox', arrowsize=FONT_SIZE*2)
+        defaultFont.configure(size=font_size)
+        style.configure('TSpinbox', arrowsize=font_size*2)
         style.configure(
-            BOLD_STYLE, font=(FONT, FONT_SIZE, font.BOLD), 
+            BOLD_STYLE, font=(FONT, font_size, font.BOLD), 
             padding=padding, 
         )
         style.configure(
-            SMALL_STYLE, font=(FONT, FONT_SIZE // 3), 
+            SMALL_STYLE, font=(FONT, font_size // 3), 
             padding=(0, 0), 
         )
-
-        self.bottomPanel = BottomPanel(self, self)
-        upperBody = ttk.Frame(self)
-        upperBody.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-        self.leftPanel = LeftPanel(self, upperBody)
-        self.leftPanel.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        rightBody = ttk.Frame(upperBody)
-        rightBody.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
-        self.publicZoneTopPanel = PublicZoneTopPanel(self, rightBody)
-        self.publicZone = PublicZone(self, rightBody)
+        self.textFont.configure(size=font_size)
+        self.boldTextFont.configure(size=font_size)
+    
+    def zoomTo(self, zoom_step: int):
+        zoom_step = min(len(ZOOM_LADDER) - 1, max(0, zoom_step))
+        if zoom_step == self.zoom_step:
+            return
+        self.zoom_step = zoom_step
+        if self.texture is not None:
+            self.texture.setZoom(ZOOM_LADDER[zoom_step])
+        self.applyStyles()
+        self.leftPanel.rescale()
+        self.publicZone.rescale()
         self.refresh()
-        def freezeSize():
-            self.geometry(f'{self.winfo_width()}x{self.winfo_height()}')
-        self.after(100, freezeSize)
+        # let the window take its natural size at the new zoom
+        self.geometry('')
+        self.after(100, self.freezeSize)
+        writeConfig('zoom_step', zoom_step)
     
-    def onUpdateGamestate(self, gamestate: Gamestate):
+    def onUpdateGamestate(self, gamestate: Gamestate, acked_seq: int):
         print('Server: update gamestate')
         for smartCard in gamestate.AllSmartCards():
             self.serverClock.onReceiveServerTime(smartCard.birth)
-        if not self.gamestate.isCardSelectionEqual(gamestate):
+        if not self.predictor.authoritative.isCardSelectionEqual(gamestate):
             self.last_info_change = time.time()
-        self.gamestate = gamestate
+        self.gamestate = self.predictor.reconcile(gamestate, acked_seq)
         self.refresh()
-        with open(f'./logs/{self.uuid}.txt', 'w') as f:
-            self.gamestate.printDebug(file=f)
+        if self.debugRecorder is not None:
+            self.debugRecorder.record(gamestate)
+    
+    def onTextureReady(self, texture: Texture):
+        self.texture = texture
+        texture.setZoom(ZOOM_LADDER[self.zoom_step])
+        # re-renders the placeholders
+        self.leftPanel.rescale()
+        self.publicZone.rescale()
+        self.refresh()
+        self.startupTimer.reach('texture ready')
     
     def onUnexpectedDisconnect(self):
         msg = 'Error: Unexpected disconnection by server.'
         print(msg)
-        async def f():
-            async with self.dialogLock:
-                messagebox.showerror(msg, msg)
-                self.is_closed = True
-        self.dialogQueue.append(f())
+        def f():
+            messagebox.showerror(msg, msg)
+            self.close()
+        self.openDialog(f)
     
     def getMyself(self):
         return self.gamestate.seekPlayer(self.uuid)
     
     def refresh(self):
+        self.keepAnimating()
         self.bottomPanel.refresh()
         self.leftPanel.refresh()
         self.publicZoneTopPanel.refresh()
         self.publicZone.refresh()
 
-    def getPlayer(self, player_i: int):
-        return self.gamestate.players[player_i]
-    
     def newButton(
         self, parent: tk.Widget | tk.Tk, text: str, 
         command: tp.Callable, special_shortcut: str | None = None,
@@ -278,6 +502,7 @@ class Root(tk.Tk):
         self.leftPanel.animate()
         self.publicZone.animate()
         self.bottomPanel.animate()
+        self.messageLog.animate()
 
 class BottomPanel(ttk.Frame):
     def __init__(self, root: Root, parent: tk.Widget | tk.Tk):
@@ -327,14 +552,13 @@ class BottomPanel(ttk.Frame):
         self.root.submit({ CEF.TYPE: CET.VOTE, CEF.VOTE: Vote.IDLE })
     
     def speak(self):
-        async def f():
-            async with self.root.dialogLock:
-                speech = simpledialog.askstring(
-                    'Speak', 'Send a message to everyone:',
-                )
-                if speech is not None:
-                    self.root.submit({ CEF.TYPE: CET.SPEAK, CEF.TARGET_VALUE: speech })
-        self.root.dialogQueue.append(f())
+        def f():
+            speech = simpledialog.askstring(
+                'Speak', 'Send a message to everyone:',
+            )
+            if speech is not None:
+                self.root.submit({ CEF.TYPE: CET.SPEAK, CEF.TARGET_VALUE: speech })
+        self.root.openDialog(f)
 
     def callSet(self):
         if self.root.getMyself().shouted_set is None:
@@ -365,30 +589,87 @@ class BottomPanel(ttk.Frame):
             time.time() < self.root.last_undo_by_others + UNDO_ALLOWED_AFTER
         ))
 
+class MessageLog(ttk.Frame):
+    '''
+    Server messages and chat, shown without blocking the mainloop.
+    '''
+    TITLE_TAG = 'title'
+    FRESH_TAG = 'fresh'
+
+    def __init__(self, root: Root, parent: tk.Widget | tk.Tk):
+        super().__init__(parent)
+        self.root = root
+        self.pack(side=tk.BOTTOM, fill=tk.X)
+        self.config(borderwidth=1, relief=tk.SOLID)
+        self.fresh_until = 0.0
+
+        self.text = tk.Text(
+            self, height=MESSAGE_LOG_LINES, wrap=tk.WORD, 
+            font=root.textFont, state=tk.DISABLED, takefocus=False, 
+        )
+        scrollbar = ttk.Scrollbar(self, command=self.text.yview)
+        self.text.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.text.tag_configure(self.TITLE_TAG, font=root.boldTextFont)
+        self.text.tag_configure(self.FRESH_TAG, background='yellow')
+    
+    def post(self, title: str, msg: str):
+        msg = msg.rstrip('\n')
+        was_at_bottom = self.text.yview()[1] >= 1.0
+        self.text.config(state=tk.NORMAL)
+        self.text.tag_remove(self.FRESH_TAG, '1.0', tk.END)
+        start = self.text.index('end-1c')
+        self.text.insert(tk.END, title, self.TITLE_TAG)
+        self.text.insert(tk.END, ('\n' if '\n' in msg else ' ') + msg + '\n')
+        self.text.tag_add(self.FRESH_TAG, start, 'end-1c')
+        n_lines = int(self.text.index('end-1c').split('.')[0]) - 1
+        if n_lines > MESSAGE_LOG_KEEP:
+            self.text.delete('1.0', f'{n_lines - MESSAGE_LOG_KEEP + 1}.0')
+        self.text.config(state=tk.DISABLED)
+        if was_at_bottom:
+            self.text.see(tk.END)
+        self.fresh_until = time.time() + FRESH_MESSAGE_LASTS_FOR
+    
+    def animate(self):
+        if self.fresh_until and time.time() > self.fresh_until:
+            self.fresh_until = 0.0
+            self.text.tag_remove(self.FRESH_TAG, '1.0', tk.END)
+
 class LeftPanel(ttk.Frame):
     def __init__(self, root: Root, parent: tk.Widget | tk.Tk):
         super().__init__(parent)
         self.root = root
 
         self.selfConfigBar = SelfConfigBar(root, self)
-        self.playerStripes: tp.List[PlayerStripe] = []
+        self.playerStripes: tp.Dict[str, PlayerStripe] = {}
+        self.stripe_order: tp.List[str] = []
         self.deckArea = DeckArea(root, self)
     
     def refresh(self):
-        if len(self.playerStripes) != len(self.root.gamestate.players):
-            for stripe in self.playerStripes:
-                stripe.destroy()
-            self.playerStripes = [
-                PlayerStripe(self.root, self, i)
-                for i in range(len(self.root.gamestate.players))
-            ]
-        for playerStripe in self.playerStripes:
+        # Only the stripes of who joined or left are built or destroyed.
+        order = self.root.gamestate.getUuids()
+        if order != self.stripe_order:
+            for uuid in self.playerStripes.keys() - set(order):
+                self.playerStripes.pop(uuid).destroy()
+            for uuid in order:
+                if uuid not in self.playerStripes:
+                    self.playerStripes[uuid] = PlayerStripe(self.root, self, uuid)
+                self.playerStripes[uuid].pack_forget()
+            for uuid in order:
+                self.playerStripes[uuid].pack(side=tk.TOP, fill=tk.X)
+            self.stripe_order = order
+        for playerStripe in self.playerStripes.values():
             playerStripe.refresh()
         self.deckArea.refresh()
     
     def animate(self):
-        for playerStripe in self.playerStripes:
+        for playerStripe in self.playerStripes.values():
             playerStripe.animate()
+    
+    def rescale(self):
+        for playerStripe in self.playerStripes.values():
+            playerStripe.displayCase.rescale()
 
 class SelfConfigBar(ttk.Frame):
     def __init__(self, root: Root, parent: tk.Widget | tk.Tk):
@@ -415,37 +696,40 @@ class SelfConfigBar(ttk.Frame):
         self.labelPing.pack(
             side=tk.RIGHT, padx=PADX, pady=PADY, 
         )
+
+        self.labelBacklog = ttk.Label(self, text='')
+        self.labelBacklog.pack(
+            side=tk.RIGHT, padx=PADX, pady=PADY, 
+        )
     
     def changeMyName(self):
-        async def f():
-            async with self.root.dialogLock:
-                old_name = self.root.getMyself().name
-                new_name = simpledialog.askstring(
-                    'Change My Name', 'Enter new name:', initialvalue=old_name, 
-                )
-                if new_name is None:
-                    return
-                self.changeNameTo(new_name)
-                writeConfig('last_name', new_name)
-        self.root.dialogQueue.append(f())
+        def f():
+            old_name = self.root.getMyself().name
+            new_name = simpledialog.askstring(
+                'Change My Name', 'Enter new name:', initialvalue=old_name, 
+            )
+            if new_name is None:
+                return
+            self.changeNameTo(new_name)
+            writeConfig('last_name', new_name)
+        self.root.openDialog(f)
     
     def changeNameTo(self, new_name: str):
         self.root.submit({ CEF.TYPE: CET.CHANGE_NAME, CEF.TARGET_VALUE: new_name })
     
     def changeMyColor(self):
-        async def f():
-            async with self.root.dialogLock:
-                old_color = self.root.getMyself().color
-                new_color = simpledialog.askstring(
-                    'Change My Color', 
-                    'Enter new color "r,g,b", 0 <= each <= 255. Hint: use a dark color for better contrast.', 
-                    initialvalue=old_color, 
-                )
-                if new_color is None:
-                    return
-                self.changeColorTo(new_color)
-                writeConfig('last_color', new_color)
-        self.root.dialogQueue.append(f())
+        def f():
+            old_color = self.root.getMyself().color
+            new_color = simpledialog.askstring(
+                'Change My Color', 
+                'Enter new color "r,g,b", 0 <= each <= 255. Hint: use a dark color for better contrast.', 
+                initialvalue=old_color, 
+            )
+            if new_color is None:
+                return
+            self.changeColorTo(new_color)
+            writeConfig('last_color', new_color)
+        self.root.openDialog(f)
     
     def changeColorTo(self, new_color: str):
         self.root.submit({ CEF.TYPE: CET.CHANGE_COLOR, CEF.TARGET_VALUE: new_color })
@@ -453,13 +737,12 @@ class SelfConfigBar(ttk.Frame):
 class PlayerStripe(ttk.Frame):
     def __init__(
         self, root: Root, parent: tk.Widget | tk.Tk, 
-        player_i: int, 
+        uuid: str, 
     ):
         super().__init__(parent)
         self.root = root
-        self.pack(side=tk.TOP, fill=tk.X)
         self.config(borderwidth=1, relief=tk.SOLID)
-        self.player_i = player_i
+        self.uuid = uuid
 
         self.col_0 = ttk.Frame(self)
         self.col_0.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
@@ -497,7 +780,7 @@ class PlayerStripe(ttk.Frame):
             expand=True,
         )
 
-        self.displayCase = DisplayCase(root, self.col_1, player_i)
+        self.displayCase = DisplayCase(root, self.col_1, uuid)
 
         self.thicknessIndicator = ThicknessIndicator(
             self.col_2, THICKNESS_INDICATOR_WEALTH, 
@@ -508,20 +791,22 @@ class PlayerStripe(ttk.Frame):
             side=tk.TOP, fill=tk.X, padx=PADX, pady=(0, 0),
         )
         
-        self.winCounter = WinCounter(root, self.col_2, player_i)
+        self.winCounter = WinCounter(root, self.col_2, uuid)
         self.winCounter.pack(side=tk.TOP, padx=PADX, pady=(0, PADY))
     
     def refresh(self):
-        player = self.root.getPlayer(self.player_i)
+        player = self.root.gamestate.seekPlayer(self.uuid)
         
         self.labelName.config(text=player.name)
         self.labelName.config(background=rgbToHex(*player.getRGB()))
+        if player.shouted_set is None:
+            shout_text = ' ' * 35
+        elif player.shouted_set == PREDICTED_SHOUT:
+            shout_text = 'Set! ...'
+        else:
+            shout_text = f'Set! {player.shouted_set:.2f} sec'
         self.labelShoutSet.config(
-            text=(
-                f'Set! {player.shouted_set:.2f} sec' 
-                if player.shouted_set is not None else 
-                ' ' * 35
-            ), 
+            text=shout_text, 
             background=(
                 'black' if player.shouted_set is not None else 'white'
             ),
@@ -541,16 +826,16 @@ class PlayerStripe(ttk.Frame):
 class DisplayCase(ttk.Frame):
     def __init__(
         self, root: Root, parent: tk.Widget | tk.Tk, 
-        player_i: int,
+        uuid: str,
     ):
         super().__init__(parent)
         self.root = root
         self.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
-        self.player_i = player_i
+        self.uuid = uuid
 
         self.smartCardWidgets = [
-            SmartCardWidget(root, self, False, (player_i, i), None)
-            for i in range(4)
+            SmartCardWidget(root, self, False, (uuid, i), None)
+            for i in range(DISPLAY_CASE_SIZE)
         ]
         [x.pack(
             side=tk.LEFT, 
@@ -563,12 +848,40 @@ class DisplayCase(ttk.Frame):
     def animate(self):
         for smartCardWidget in self.smartCardWidgets:
             smartCardWidget.animate()
+    
+    def rescale(self):
+        for smartCardWidget in self.smartCardWidgets:
+            smartCardWidget.layout()
+
+def mergeColors(colors: tp.List[tp.List[int]]):
+    # Tints white with the colors of who selected the card.
+    colors_ = [(255, 255, 255), *colors]
+    loadings = [5.0] + [1.0] * len(colors)
+    merger = [0.0, 0.0, 0.0]
+    for c, l in zip(colors_, loadings):
+        for i in range(3):
+            merger[i] += c[i] * l
+    return tuple(round(x / sum(loadings)) for x in merger)
+
+def heatColor(base_color: tp.Tuple[int, ...], heat: float):
+    heat = min(1.0, max(0.0, heat))
+    darkness = round(heat * 255)
+    return rgbToHex(*[
+        min(255, max(0, x - darkness)) for x in base_color
+    ])
+
+def heatOf(root: Root, smartCard: SmartCard | None):
+    if smartCard is None:
+        return 0.0
+    return 1.0 - (
+        root.serverClock.get() - smartCard.birth
+    ) / HEAT_LASTS_FOR
 
 class SmartCardWidget(ttk.Frame):
     def __init__(
         self, root: Root, parent: tk.Widget | tk.Tk, 
         is_public_not_display_case: bool, 
-        coord: tp.Tuple[int, int],
+        coord: tp.Tuple[int, int] | tp.Tuple[str, int],
         smartCard: SmartCard | None,
     ):
         self.unique_style_name = str(uuid4()) + '.TFrame'
@@ -578,43 +891,42 @@ class SmartCardWidget(ttk.Frame):
         self.coord = coord
         self.smartCard = smartCard
 
-        if is_public_not_display_case:
-            card_width  = CARD_WIDTH
-            card_height = CARD_HEIGHT
-            padx = PADX
-            pady = PADY
-        else:
-            card_width  = round(SMALL_CARD_RATIO * CARD_WIDTH)
-            card_height = round(SMALL_CARD_RATIO * CARD_HEIGHT)
-            padx = round(SMALL_CARD_RATIO * PADX)
-            pady = round(SMALL_CARD_RATIO * PADY)
-
-        self.checksBar = ttk.Frame(
-            self, style=self.unique_style_name, 
-            height=SELECTION_MARKER_SIZE, 
-        )
+        self.checksBar = ttk.Frame(self, style=self.unique_style_name)
         self.checksBar.pack_propagate(False)
-        self.checksBar.pack(side=tk.TOP, padx=PADX, pady=(max(
-            0, pady - SELECTION_MARKER_SIZE, 
-        ), 0), fill=tk.X)
+        self.checksBar.pack(side=tk.TOP, fill=tk.X)
         self.checks: tp.List[tk.Canvas] = []
     
-        self.canvas = tk.Canvas(
-            self, width=card_width, height=card_height, 
-            highlightthickness=0, bd=0,
-        )
-        self.canvas.pack(side=tk.TOP, padx=padx, pady=(0, pady))
+        self.canvas = tk.Canvas(self, highlightthickness=0, bd=0)
+        self.canvas.pack(side=tk.TOP)
         self.          bind('<Button-1>', self.onClick)
         self.canvas   .bind('<Button-1>', self.onClick)
         self.checksBar.bind('<Button-1>', self.onClick)
 
-        self.last_rendered_card: Card | None | bool = False
         self.cached_base_color = (255, 255, 255)
+        self.layout()
         self.setHeat(0)
+    
+    def layout(self):
+        # Sizes everything for the current zoom. Forces a re-render.  
+        px = self.root.px
+        ratio = 1.0 if self.is_public_not_display_case else SMALL_CARD_RATIO
+        card_width  = px(ratio * CARD_WIDTH)
+        card_height = px(ratio * CARD_HEIGHT)
+        padx = px(ratio * PADX)
+        pady = px(ratio * PADY)
+
+        self.checksBar.config(height=px(SELECTION_MARKER_SIZE))
+        self.checksBar.pack_configure(padx=px(PADX), pady=(max(
+            0, pady - px(SELECTION_MARKER_SIZE), 
+        ), 0))
+        self.canvas.config(width=card_width, height=card_height)
+        self.canvas.pack_configure(padx=padx, pady=(0, pady))
+        self.last_rendered_card: int | None = -1   # -1: never rendered
 
     def newCheck(self, color: str):
+        marker_size = self.root.px(SELECTION_MARKER_SIZE)
         canvas = tk.Canvas(
-            self.checksBar, width=SELECTION_MARKER_SIZE * 2, height=SELECTION_MARKER_SIZE,
+            self.checksBar, width=marker_size * 2, height=marker_size,
             highlightthickness=0, bd=0,
         )
         padx = 3
@@ -622,7 +934,7 @@ class SmartCardWidget(ttk.Frame):
         #     padx = round(SMALL_CARD_RATIO * padx)
         canvas.pack(side=tk.LEFT, padx=(0, padx))
         canvas.create_rectangle(
-            0, 0, SELECTION_MARKER_SIZE * 2, SELECTION_MARKER_SIZE,
+            0, 0, marker_size * 2, marker_size,
             fill=color, outline=color,
         )
         return canvas
@@ -640,53 +952,36 @@ class SmartCardWidget(ttk.Frame):
                 colors.append(rgb)
                 check = self.newCheck(rgbToHex(*rgb))
                 self.checks.append(check)
-        def mergeColors():
-            colors_ = [(255, 255, 255), *colors]
-            loadings = [5.0] + [1.0] * len(colors)
-            merger = [0.0, 0.0, 0.0]
-            for c, l in zip(colors_, loadings):
-                for i in range(3):
-                    merger[i] += c[i] * l
-            return tuple(round(x / sum(loadings)) for x in merger)
-        self.cached_base_color = mergeColors()
-
-        card = smartCard and smartCard.card
-        if self.last_rendered_card != card:
-            self.last_rendered_card = card
+        self.cached_base_color = mergeColors(colors)
+
+        card_id = smartCard and smartCard.card_id
+        if self.last_rendered_card != card_id:
+            self.last_rendered_card = card_id
             self.canvas.delete('all')
+            is_placeholder = card_id is not None and self.root.texture is None
             self.canvas.create_rectangle(
-                0, 0, CARD_WIDTH, CARD_HEIGHT,
-                fill='white', outline='white',
+                0, 0, self.root.px(CARD_WIDTH), self.root.px(CARD_HEIGHT),
+                fill=PLACEHOLDER_COLOR if is_placeholder else 'white', 
+                outline='white',
             )
-            if card is not None:
+            if card_id is not None and self.root.texture is not None:
                 self.canvas.create_image(
                     0, 0, anchor=tk.NW, 
                     image=self.root.texture.get(
-                        *card, not self.is_public_not_display_case, 
+                        card_id, not self.is_public_not_display_case, 
                     ), 
                 )
     
     def animate(self):
         if not self.winfo_exists():
             return
-        if self.smartCard is None:
-            heat = 0.0
-        else:
-            heat = 1.0 - (
-                self.root.serverClock.get() - self.smartCard.birth
-            ) / HEAT_LASTS_FOR
-        self.setHeat(heat)
+        self.setHeat(heatOf(self.root, self.smartCard))
 
     def setHeat(self, heat: float):
-        heat = min(1.0, max(0.0, heat))
-        darkness = round(heat * 255)
-        color = [
-            min(255, max(0, x - darkness)) for x in self.cached_base_color
-        ]
         style = ttk.Style()
         style.configure(
             self.unique_style_name, 
-            background=rgbToHex(*color), 
+            background=heatColor(self.cached_base_color, heat), 
         )
     
     def onClick(self, _):
@@ -696,10 +991,10 @@ class SmartCardWidget(ttk.Frame):
                 CEF.TARGET_VALUE: self.coord, 
             })
         else:
-            player_i, card_i = self.coord
+            uuid, card_i = self.coord
             self.root.submit({ 
                 CEF.TYPE: CET.TOGGLE_SELECT_CARD_DISPLAY, 
-                CEF.TARGET_PLAYER: self.root.gamestate.players[player_i].uuid, 
+                CEF.TARGET_PLAYER: uuid, 
                 CEF.TARGET_VALUE: card_i, 
             })
 
@@ -761,15 +1056,15 @@ class DeltaSpinbox(ttk.Spinbox, ABC):
 class WinCounter(DeltaSpinbox):
     def __init__(
         self, root: Root, parent: tk.Widget | tk.Tk, 
-        player_i: int,
+        uuid: str,
     ):
         super().__init__(root, parent, 0)
-        self.player_i = player_i
+        self.uuid = uuid
 
     def submitDelta(self, delta: int):
         self.root.submit({ 
             CEF.TYPE: CET.ACC_N_WINS, 
-            CEF.TARGET_PLAYER: self.root.getPlayer(self.player_i).uuid, 
+            CEF.TARGET_PLAYER: self.uuid, 
             CEF.TARGET_VALUE: delta, 
         })
 
@@ -792,7 +1087,15 @@ class DeckArea(ttk.Frame):
             self, text='_Deal 1 Card', command=self.dealCard, 
         )
         self.buttonDealCard.grid(
-            column=1, row=0, rowspan=2, 
+            column=1, row=0, 
+            padx=0, pady=(PADY, 0), sticky=tk.NSEW,
+        )
+
+        self.buttonDealToFill = root.newButton(
+            self, text='_Fill Table', command=self.dealToFill, 
+        )
+        self.buttonDealToFill.grid(
+            column=1, row=1, 
             padx=0, pady=PADY, sticky=tk.NSEW,
         )
         self.columnconfigure(1, weight=1)
@@ -816,6 +1119,9 @@ class DeckArea(ttk.Frame):
     def dealCard(self):
         self.root.submit({ CEF.TYPE: CET.DEAL_CARD })
     
+    def dealToFill(self):
+        self.root.submit({ CEF.TYPE: CET.DEAL_TO_FILL })
+    
     def countCards(self):
         self.root.submit({ CEF.TYPE: CET.VOTE, CEF.VOTE: Vote.COUNT_CARDS })
     
@@ -863,12 +1169,9 @@ class PublicZoneTopPanel(ttk.Frame):
         zone = self.root.gamestate.public_zone
         self.rowSizer.refresh(len(zone))
         self.colSizer.refresh(len(zone[0]))
-        nothing_selected = True
-        for smartCard in self.root.gamestate.AllSmartCards():
-            if self.root.getMyself().uuid in smartCard.selected_by:
-                nothing_selected = False
-                break
-        disableIf(self.buttonClearSelection, nothing_selected)
+        disableIf(self.buttonClearSelection, not self.root.gamestate.selectedBy(
+            self.root.uuid, 
+        ))
 
 class PublicZoneSizer(DeltaSpinbox):
     def __init__(
@@ -916,7 +1219,7 @@ class PublicZone(ttk.Frame):
                 for x, widget in enumerate(row):
                     widget.grid(
                         row=y, column=x, 
-                        padx=PADX, pady=PADY,
+                        padx=self.root.px(PADX), pady=self.root.px(PADY),
                     )
             for x in range(new_n_cols):
                 self.grid_columnconfigure(x, weight=1)
@@ -930,34 +1233,283 @@ class PublicZone(ttk.Frame):
         for row in self.smartCardWidgets:
             for widget in row:
                 widget.animate()
+    
+    def rescale(self):
+        for row in self.smartCardWidgets:
+            for widget in row:
+                widget.layout()
+                widget.grid_configure(
+                    padx=self.root.px(PADX), pady=self.root.px(PADY),
+                )
+
+class CanvasPublicZone(tk.Canvas):
+    '''
+    Drop-in alternative to `PublicZone` that draws every slot on a 
+    single canvas instead of one `SmartCardWidget` per slot.  
+    Each slot owns a few canvas items, tagged "heat", "card" and 
+    "marker", which are updated in place.  
+    '''
+    def __init__(self, root: Root, parent: tk.Widget | tk.Tk):
+        super().__init__(parent, highlightthickness=0)
+        self.root = root
+        self.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.config(borderwidth=1, relief=tk.SOLID)
 
-async def main():
+        self.slots: tp.Dict[tp.Tuple[int, int], CanvasSlot] = {}
+        self.shape = (0, 0)
+        self.setMinCellSize()
+        self.cell_size = self.min_cell_size
+        self.bind('<Button-1>', self.onClick)
+        self.bind('<Configure>', lambda _: self.relayout())
+    
+    def refresh(self):
+        zone = self.root.gamestate.public_zone
+        shape = (len(zone), len(zone[0]))
+        if shape != self.shape:
+            self.reshape(shape)
+        for (y, x), slot in self.slots.items():
+            slot.refresh(zone[y][x])
+    
+    def setMinCellSize(self):
+        # mirrors the padding of `SmartCardWidget`
+        px = self.root.px
+        self.min_cell_size = (
+            px(CARD_WIDTH) + px(PADX) * 4, 
+            px(CARD_HEIGHT) + px(SELECTION_MARKER_SIZE) + px(PADY) * 3, 
+        )
+    
+    def rescale(self):
+        self.setMinCellSize()
+        for slot in self.slots.values():
+            slot.last_rendered_card = -1
+        self.resize()
+    
+    def reshape(self, shape: tp.Tuple[int, int]):
+        self.shape = shape
+        n_rows, n_cols = shape
+        for coord in [*self.slots]:
+            y, x = coord
+            if y >= n_rows or x >= n_cols:
+                self.slots.pop(coord).destroy()
+        for y in range(n_rows):
+            for x in range(n_cols):
+                if (y, x) not in self.slots:
+                    self.slots[(y, x)] = CanvasSlot(self, y, x)
+        self.resize()
+    
+    def resize(self):
+        n_rows, n_cols = self.shape
+        self.config(
+            width =n_cols * self.min_cell_size[0], 
+            height=n_rows * self.min_cell_size[1], 
+        )
+        self.relayout()
+    
+    def relayout(self):
+        n_rows, n_cols = self.shape
+        if n_rows == 0 or n_cols == 0:
+            return
+        self.cell_size = (
+            max(self.min_cell_size[0], self.winfo_width () / n_cols), 
+            max(self.min_cell_size[1], self.winfo_height() / n_rows), 
+        )
+        for slot in self.slots.values():
+            slot.place(*self.cell_size)
+    
+    def animate(self):
+        for slot in self.slots.values():
+            slot.animate()
+    
+    def onClick(self, event: tk.Event):
+        coord = (
+            int(self.canvasy(event.y) // self.cell_size[1]), 
+            int(self.canvasx(event.x) // self.cell_size[0]), 
+        )
+        if coord not in self.slots:
+            return
+        self.root.submit({ 
+            CEF.TYPE: CET.TOGGLE_SELECT_CARD_PUBLIC, 
+            CEF.TARGET_VALUE: coord, 
+        })
+
+class CanvasSlot:
+    '''
+    The canvas items of one public-zone slot in `CanvasPublicZone`.  
+    '''
+    def __init__(self, canvas: CanvasPublicZone, y: int, x: int):
+        self.canvas = canvas
+        self.root = canvas.root
+        self.y = y
+        self.x = x
+        self.tag = f'slot-{y}-{x}'
+        self.origin = (0.0, 0.0)
+        self.smartCard: SmartCard | None = None
+        self.last_rendered_card: int | None = None
+        self.last_marker_colors: tp.List[tp.List[int]] = []
+        self.cached_base_color = (255, 255, 255)
+        self.last_heat_color = ''
+
+        tags = (self.tag, 'heat')
+        self.heat = canvas.create_rectangle(
+            0, 0, 0, 0, width=0, fill='white', tags=tags, 
+        )
+        tags = (self.tag, 'card')
+        self.blank = canvas.create_rectangle(
+            0, 0, 0, 0, width=0, fill='white', tags=tags, 
+        )
+        self.image = canvas.create_image(
+            0, 0, anchor=tk.NW, state=tk.HIDDEN, tags=tags, 
+        )
+    
+    def place(self, cell_width: float, cell_height: float):
+        px = self.root.px
+        card_width, card_height = px(CARD_WIDTH), px(CARD_HEIGHT)
+        marker_size, padx, pady = px(SELECTION_MARKER_SIZE), px(PADX), px(PADY)
+        cell_x = self.x * cell_width
+        cell_y = self.y * cell_height
+        # the card is centered in the cell, like grid() does for widgets
+        left = cell_x + (cell_width - card_width) / 2
+        top = cell_y + (cell_height - card_height + marker_size) / 2
+        self.origin = (left, top)
+        self.canvas.coords(
+            self.heat, 
+            left - padx, top - marker_size - pady, 
+            left + card_width + padx, top + card_height + pady, 
+        )
+        self.canvas.coords(self.blank, left, top, left + card_width, top + card_height)
+        self.canvas.coords(self.image, left, top)
+        self.drawMarkers()
+    
+    def refresh(self, smartCard: SmartCard | None):
+        self.smartCard = smartCard
+        colors = []
+        if smartCard is not None:
+            for uuid in smartCard.selected_by:
+                colors.append(self.root.gamestate.seekPlayer(uuid).getRGB())
+        if colors != self.last_marker_colors:
+            self.last_marker_colors = colors
+            self.cached_base_color = mergeColors(colors)
+            self.drawMarkers()
+
+        card_id = smartCard and smartCard.card_id
+        if self.last_rendered_card != card_id:
+            self.last_rendered_card = card_id
+            if card_id is None or self.root.texture is None:
+                self.canvas.itemconfig(self.image, state=tk.HIDDEN)
+                self.canvas.itemconfig(self.blank, fill=(
+                    'white' if card_id is None else PLACEHOLDER_COLOR
+                ))
+            else:
+                self.canvas.itemconfig(self.blank, fill='white')
+                self.canvas.itemconfig(
+                    self.image, state=tk.NORMAL, 
+                    image=self.root.texture.get(card_id, False), 
+                )
+    
+    def drawMarkers(self):
+        self.canvas.delete(self.tag + '&&marker')
+        left, top = self.origin
+        marker_size = self.root.px(SELECTION_MARKER_SIZE)
+        marker_top = top - marker_size
+        for i, rgb in enumerate(self.last_marker_colors):
+            marker_left = left + i * (marker_size * 2 + 3)
+            color = rgbToHex(*rgb)
+            self.canvas.create_rectangle(
+                marker_left, marker_top, 
+                marker_left + marker_size * 2, top, 
+                fill=color, outline=color, tags=(self.tag, 'marker'), 
+            )
+    
+    def animate(self):
+        color = heatColor(self.cached_base_color, heatOf(self.root, self.smartCard))
+        if color != self.last_heat_color:
+            self.last_heat_color = color
+            self.canvas.itemconfig(self.heat, fill=color)
+    
+    def destroy(self):
+        self.canvas.delete(self.tag)
+
+async def handshake(
+    reader: StreamReader, writer: StreamWriter, table: str, 
+    onReconnect: tp.Callable[[StreamWriter], None], 
+):
+    '''
+    `onReconnect` learns of the new connection on a REDIRECT, so that 
+    the caller closes the live one whatever happens next.  
+    '''
+    await sendPrimitive(handshakeOf(table), writer)
+    print('Waiting for player ID assignment...')
+    event = await recvPrimitive(reader)
+    if SET(event[SEF.TYPE]) == SET.REDIRECT:
+        # A supervisor. The table lives in one of its workers. 
+        port = event[SEF.CONTENT]
+        print(f'Table {table!r} is on port {port}.')
+        host = writer.get_extra_info('peername')[0]
+        await disconnect(writer)
+        reader, writer = await openConnection(host, port)
+        onReconnect(writer)
+        await sendPrimitive(handshakeOf(table), writer)
+        event = await recvPrimitive(reader)
+    if SET(event[SEF.TYPE]) == SET.POPUP_MESSAGE:
+        # Turned away
+        title, msg = event[SEF.CONTENT]
+        print(f'{title}: {msg}')
+        raise ConnectionRefusedError(msg)
+    assert SET(event[SEF.TYPE]) == SET.YOU_ARE
+    uuid = event[SEF.CONTENT]
+    print('ok')
+    print('My player ID:', uuid)
+    # The server sends the gamestate first, so the board can show 
+    # while the texture downloads.  
+    print('Waiting for gamestate...')
+    event = await recvPrimitive(reader)
+    assert SET(event[SEF.TYPE]) == SET.GAMESTATE
+    gamestate = Gamestate.fromPrimitive(event[SEF.CONTENT])
+    print('ok')
+    return reader, writer, uuid, gamestate, event[SEF.VERSION]
+
+def main():
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
     for filename in os.listdir('./logs'):
         if filename.endswith('.txt'):
             os.remove(f'./logs/{filename}')
-    async with Network() as (reader, writer):
-        await sendPrimitive(HANDSHAKE, writer)
-        print('Waiting for player ID assignment...')
-        event = await recvPrimitive(reader)
-        assert SET(event[SEF.TYPE]) == SET.YOU_ARE
-        uuid = event[SEF.CONTENT]
-        print('ok')
-        print('My player ID:', uuid)
-        print('Waiting for texture...')
-        texture_data = gzip.decompress(await recvStream(reader))
-        print('ok')
-        with open(PNG, 'wb') as f:
-            f.write(texture_data)
-        print('Waiting for gamestate...')
-        event = await recvPrimitive(reader)
-        assert SET(event[SEF.TYPE]) == SET.GAMESTATE
-        gamestate = Gamestate.fromPrimitive(event[SEF.CONTENT])
-        print('ok')
-        queue: asyncio.Queue[tp.Dict | None] = asyncio.Queue()
-        receiveTask = asyncio.create_task(receiver(reader, queue))
+    # Tk keeps the main thread. The sockets live in the network thread. 
+    network = NetworkThread()
+    reader, writer, table = network.run(connect())
+    def onReconnect(new_writer: StreamWriter):
+        nonlocal writer
+        writer = new_writer
+    try:
+        startupTimer = StartupTimer()
+        reader, writer, uuid, gamestate, version = network.run(
+            handshake(reader, writer, table, onReconnect), 
+        )
+        startupTimer.reach('gamestate')
+
+        root = Root(network, writer, uuid, gamestate, version, startupTimer)
 
-        root = Root(queue, writer, uuid, gamestate)
+        def deliver(event: tp.Dict | None):
+            root.callSoonThreadsafe(root.onServerEvent, event)
+
+        async def receive():
+            try:
+                texture = await downloadTexture(reader, root)
+            except (
+                asyncio.IncompleteReadError, 
+                BrokenPipeError,
+                ConnectionAbortedError, ConnectionResetError, 
+                TimeoutError, 
+            ):
+                deliver(None)
+                return
+            root.callSoonThreadsafe(root.onTextureReady, texture)
+            await receiver(reader, deliver)
+
+        receiveTask = network.spawn(receive())
+        sendTask = network.spawn(sender(
+            writer, root.outgoing, 
+            lambda n_frames: root.callSoonThreadsafe(root.onSent, n_frames), 
+        ))
 
         def applyLastConfig():
             config = loadConfig()
@@ -973,16 +1525,23 @@ async def main():
                 pass
             else:
                 root.leftPanel.selfConfigBar.changeColorTo(last_color)
+            root.zoomTo(config.get('zoom_step', DEFAULT_ZOOM_STEP))
 
         applyLastConfig()
         
         try:
-            await root.asyncMainloop()
-        except asyncio.CancelledError:
+            root.run()
+        except KeyboardInterrupt:
             pass
         finally:
             receiveTask.cancel()
-            await receiveTask
+            sendTask.cancel()
+            root.waker.close()
+            if root.debugRecorder is not None:
+                root.debugRecorder.close()
+    finally:
+        network.run(disconnect(writer))
+        network.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
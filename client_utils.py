@@ -3,6 +3,10 @@ from __future__ import annotations
 import typing as tp
 import time
 import json
+import threading
+import socket
+import asyncio
+from collections import deque
 
 import tkinter as tk
 import tkinter.ttk as ttk
@@ -69,3 +73,138 @@ def writeConfig(key: str, value: tp.Any):
     config[key] = value
     with open(CONFIG, 'w') as f:
         json.dump(config, f)
+
+class DebugRecorder:
+    '''
+    Keeps the last `keep` gamestates in memory and dumps them to `path` 
+    from a background thread, at most once every `interval` seconds.  
+    The UI thread only appends a reference.  
+    '''
+    def __init__(self, path: str, keep: int = 8, interval: float = 1.0):
+        self.path = path
+        self.interval = interval
+        self.snapshots: deque[tp.Tuple[float, tp.Any]] = deque(maxlen=keep)
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.is_closed = False
+        self.thread = threading.Thread(
+            target=self.loop, name='DebugRecorder', daemon=True, 
+        )
+        self.thread.start()
+    
+    def record(self, gamestate: tp.Any):
+        # `gamestate` must not be mutated afterwards by the caller.
+        with self.lock:
+            self.snapshots.append((time.time(), gamestate))
+        self.wake.set()
+    
+    def loop(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            self.dump()
+            if self.is_closed:
+                return
+            time.sleep(self.interval)
+    
+    def dump(self):
+        with self.lock:
+            snapshots = [*self.snapshots]
+        if not snapshots:
+            return
+        with open(self.path, 'w') as f:
+            for timestamp, gamestate in reversed(snapshots):
+                print(f'=== received at {timestamp:.3f}', file=f)
+                gamestate.printDebug(file=f)
+    
+    def close(self):
+        self.is_closed = True
+        self.wake.set()
+        self.thread.join()
+
+class StartupTimer:
+    '''
+    Prints when each startup stage is first reached, counted from 
+    the connection.  
+    '''
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.reached: tp.Set[str] = set()
+    
+    def reach(self, stage: str):
+        if stage in self.reached:
+            return
+        self.reached.add(stage)
+        print(f'[startup] {stage}: {(time.perf_counter() - self.start) * 1000:.0f} ms')
+
+class NetworkThread:
+    '''
+    Runs an asyncio loop in a daemon thread, so that the Tk mainloop 
+    can own the main thread. Every use of the sockets goes through it.  
+    '''
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name='network', daemon=True, 
+        )
+        self.thread.start()
+    
+    def spawn(self, co: tp.Coroutine):
+        return asyncio.run_coroutine_threadsafe(co, self.loop)
+    
+    def run(self, co: tp.Coroutine):
+        # blocks the calling thread
+        return self.spawn(co).result()
+    
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+class Waker:
+    '''
+    Lets other threads wake the Tk mainloop: a byte written to a 
+    socketpair makes Tk's file handler call `callback`.  
+    Where Tk has no file handlers (Windows), `callback` is polled 
+    every `poll_interval` seconds instead.  
+    '''
+    def __init__(
+        self, tkRoot: tk.Tk, callback: tp.Callable[[], None], 
+        poll_interval: float, 
+    ):
+        self.tkRoot = tkRoot
+        self.callback = callback
+        self.poll_ms = round(poll_interval * 1000)
+        self.rsock, self.wsock = socket.socketpair()
+        self.rsock.setblocking(False)
+        self.wsock.setblocking(False)
+        self.is_polling = not hasattr(tkRoot.tk, 'createfilehandler')
+        if self.is_polling:
+            tkRoot.after(self.poll_ms, self.poll)
+        else:
+            tkRoot.tk.createfilehandler(self.rsock, tk.READABLE, self.onReadable)
+    
+    def wake(self):
+        # Thread-safe. 
+        try:
+            self.wsock.send(b'\0')
+        except BlockingIOError:
+            pass    # full, so a wakeup is pending anyway
+    
+    def onReadable(self, *_):
+        try:
+            while self.rsock.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        self.callback()
+    
+    def poll(self):
+        self.callback()
+        self.tkRoot.after(self.poll_ms, self.poll)
+    
+    def close(self):
+        if not self.is_polling:
+            self.tkRoot.tk.deletefilehandler(self.rsock)
+        self.rsock.close()
+        self.wsock.close()
@@ -0,0 +1,117 @@
+'''
+The deck: one card for every combination of `n_attributes` attributes,
+each taking one of `n_values` values. The classic deck is `Deck(4, 3)`,
+i.e., [c, f, n, s] = [color, fill, number, shape] over `range(3)`.
+A card id is the card read as a base-`n_values` number, first attribute
+most significant.
+'''
+
+from __future__ import annotations
+
+import typing as tp
+import random
+import itertools
+
+Card = tp.Tuple[int, ...]
+
+class Deck:
+    '''
+    `isSet` is bit-parallel over all attributes at once. Each card is
+    pre-encoded as a one-hot field per attribute, `n_values` bits wide
+    plus a guard bit, so per-field arithmetic never carries into the
+    next field. The game itself never calls it: the players judge a
+    set by voting. It is for tools, e.g. `benchmark.py deck`.
+    '''
+    def __init__(self, n_attributes: int = 4, n_values: int = 3):
+        self.n_attributes = n_attributes
+        self.n_values = n_values
+        self.n_cards = n_values ** n_attributes
+        self.full_mask = (1 << self.n_cards) - 1
+
+        width = n_values + 1
+        def perField(bits: int):
+            return sum(bits << (a * width) for a in range(n_attributes))
+        self.ones = perField(1)
+        self.values = perField((1 << n_values) - 1)
+        self.guards = perField(1 << n_values)
+        self.one_hots = [
+            sum(1 << (a * width + value) for a, value in enumerate(card))
+            for card in self.iterAllCards()
+        ]
+
+        # The texture sheet: the first half of the attributes pick the
+        # column, the rest the row.
+        self.sheet_shape = (
+            n_values ** (n_attributes - n_attributes // 2),
+            n_values ** (n_attributes // 2),
+        )
+
+    def iterAllCards(self) -> tp.Iterator[Card]:
+        return itertools.product(range(self.n_values), repeat=self.n_attributes)
+
+    def cardId(self, card: Card, /):
+        card_id = 0
+        for value in card:
+            card_id = card_id * self.n_values + value
+        return card_id
+
+    def cardOf(self, card_id: int, /) -> Card:
+        card = []
+        for _ in range(self.n_attributes):
+            card_id, value = divmod(card_id, self.n_values)
+            card.append(value)
+        return tuple(reversed(card))
+
+    def sheetPosition(self, card_id: int, /):
+        '''
+        (x, y) of the card in the texture sheet, in cards.
+        '''
+        return divmod(card_id, self.sheet_shape[1])
+
+    def isSet(self, card_ids: tp.Sequence[int]):
+        '''
+        `n_values` distinct cards where every attribute is either all
+        the same or all different.
+        '''
+        if len(card_ids) != self.n_values or len(set(card_ids)) != self.n_values:
+            return False
+        seen = 0
+        for card_id in card_ids:
+            seen |= self.one_hots[card_id]
+        # Every field has at least one bit, so subtracting 1 per field
+        # never borrows. What is left is non-zero iff the field has
+        # more than one value, i.e., not all the same.
+        mixed = seen & (seen - self.ones)
+        # non-zero iff the field misses some value, i.e., not all different
+        missing = self.values & ~seen
+        # Adding `values` sets the guard bit iff the field is non-zero.
+        return (mixed + self.values) & (missing + self.values) & self.guards == 0
+
+def testDeck():
+    for n_attributes, n_values in ((4, 3), (5, 3), (3, 4)):
+        deck = Deck(n_attributes, n_values)
+        cards = [*deck.iterAllCards()]
+        assert len(cards) == deck.n_cards
+        for i, card in enumerate(cards):
+            assert deck.cardId(card) == i
+            assert deck.cardOf(i) == card
+        positions = {deck.sheetPosition(i) for i in range(deck.n_cards)}
+        assert len(positions) == deck.n_cards
+        assert max(positions) == (deck.sheet_shape[0] - 1, deck.sheet_shape[1] - 1)
+        for _ in range(1000):
+            card_ids = random.sample(range(deck.n_cards), n_values)
+            expected = all(
+                len({deck.cardOf(i)[a] for i in card_ids}) in (1, n_values)
+                for a in range(n_attributes)
+            )
+            assert deck.isSet(card_ids) == expected
+        assert not deck.isSet([0] * n_values)
+    deck = Deck(4, 3)
+    assert sum(
+        deck.isSet(card_ids)
+        for card_ids in itertools.combinations(range(deck.n_cards), 3)
+    ) == 1080
+
+if __name__ == '__main__':
+    testDeck()
+    print('ok')
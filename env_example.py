@@ -49,6 +49,21 @@ THICKNESS_INDICATOR_CARD_PER_LINE = 3
 PADX = round(12 * GLOBAL_SCALING)
 PADY = round(12 * GLOBAL_SCALING)
 
+# how to draw the public zone: 
+# 'widgets' uses one widget per card. 
+# 'canvas' draws everything on a single canvas, faster for large zones. 
+PUBLIC_ZONE_RENDERER = 'widgets'
+
+# height of the message log, in lines
+MESSAGE_LOG_LINES = 4
+
+# dump the last few received gamestates to ./logs/ for debugging. 
+# set to False in production to skip the bookkeeping entirely. 
+DEBUG_SNAPSHOT_ENABLED = True
+DEBUG_SNAPSHOT_KEEP = 8
+# min seconds between two dumps
+DEBUG_SNAPSHOT_INTERVAL = 1.0
+
 # Don't change the below. 
 CARD_HEIGHT = round(CARD_WIDTH * CARD_ASPECT[1] / CARD_ASPECT[0])
 TEXTURE_SCALE = round(TEXTURE_RESOLUTION / 3 / CARD_ASPECT[1])
@@ -10,3 +10,21 @@ except ImportError:
             fout.write(fin.read())
 
     from env import *
+
+# Settings added since. An env.py copied before lacks them, so they 
+# default to the values in env_example.py. 
+_missing = []
+
+def _default(name, value):
+    if name not in globals():
+        globals()[name] = value
+        _missing.append(name)
+
+_default('DEBUG_SNAPSHOT_ENABLED', True)
+_default('DEBUG_SNAPSHOT_KEEP', 8)
+_default('DEBUG_SNAPSHOT_INTERVAL', 1.0)
+_default('PUBLIC_ZONE_RENDERER', 'widgets')
+_default('MESSAGE_LOG_LINES', 4)
+
+if _missing:
+    print(f'env.py lacks {", ".join(_missing)}. Using the defaults. See env_example.py.')
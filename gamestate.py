@@ -2,16 +2,16 @@ from __future__ import annotations
 
 import typing as tp
 import sys
-from dataclasses import dataclass, asdict, field
+from dataclasses import dataclass, field
 from pprint import pprint
 
 from shared import *
 
-@dataclass()
+@dataclass(slots=True)
 class Player:
     @staticmethod
     def newDisplayCase() -> tp.List[SmartCard | None]:
-        return [None] * 4
+        return [None] * DISPLAY_CASE_SIZE
 
     uuid: str
     name: str
@@ -23,23 +23,18 @@ class Player:
     display_case: tp.List[SmartCard | None] = field(default_factory=newDisplayCase)
     display_case_hidden: bool = False
 
-    def mutableHash(self, verbose: bool = False):
-        t = (
-            self.uuid, self.name, self.color, self.voting.value, 
-            self.shouted_set, self.wealth_thickness, self.n_of_wins, 
-            tuple([card and card.mutableHash() for card in self.display_case]), 
-            self.display_case_hidden, 
-        )
-        if verbose:
-            for i, e in enumerate(t):
-                print('player', i, deterministicHash(e))
-        return deterministicHash(t)
-
     def toPrimitive(self):
-        d = asdict(self)
-        d['display_case'] = [card and card.toPrimitive() for card in self.display_case]
-        d['voting'] = self.voting.value
-        return d
+        return {
+            'uuid': self.uuid, 
+            'name': self.name, 
+            'color': self.color, 
+            'voting': self.voting.value, 
+            'shouted_set': self.shouted_set, 
+            'wealth_thickness': self.wealth_thickness, 
+            'n_of_wins': self.n_of_wins, 
+            'display_case': [card and card.toPrimitive() for card in self.display_case], 
+            'display_case_hidden': self.display_case_hidden, 
+        }
     
     @classmethod
     def fromPrimitive(cls, d: dict):
@@ -58,34 +53,23 @@ class Player:
     def getRGB(self):
         return [int(x) for x in self.color.split(',')]
 
-@dataclass()
+@dataclass(slots=True, eq=False)   # hashed by identity, for the selection index
 class SmartCard:
-    card: Card
+    card_id: int    # see `cardId()`
     birth: float
     selected_by: tp.List[str] = field(default_factory=list)
 
-    def mutableHash(self, verbose: bool = False):
-        h = deterministicHash((
-            self.card, self.birth, tuple(self.selected_by),
-        ))
-        if verbose:
-            print('SmartCard:', h)
-        return h
-
     def toPrimitive(self):
-        d = asdict(self)
-        s = ''
-        s += str(self.card[0] + self.card[1] * 3)
-        s += str(self.card[2] + self.card[3] * 3)
-        d['card'] = s
-        return d
+        return {
+            'card': self.card_id, 
+            'birth': self.birth, 
+            'selected_by': [*self.selected_by], 
+        }
     
     @classmethod
     def fromPrimitive(cls, d: dict):
-        s = d['card']
-        card = (int(s[0]) % 3, int(s[0]) // 3, int(s[1]) % 3, int(s[1]) // 3)
         return cls(
-            card=card, 
+            card_id=d['card'], 
             birth=d['birth'], 
             selected_by=d['selected_by'], 
         )
@@ -96,31 +80,59 @@ class SmartCard:
         else:
             self.selected_by.append(uuid)
 
-@dataclass()
+class Slot(tp.NamedTuple):
+    owner: str | None   # None for the public zone, else whose display case
+    y: int
+    x: int
+
+NO_SELECTION: tp.FrozenSet[SmartCard] = frozenset()
+
+@dataclass(slots=True)
 class Gamestate:
-    cards_in_deck: tp.Dict[tp.Tuple[int, int, int, int], bool]
+    deck_mask: int  # bit i is set iff card id i is in the deck
     players: tp.List[Player]
     public_zone: tp.List[tp.List[SmartCard | None]]
 
-    def mutableHash(self, verbose: bool = False):
-        t = (
-            tuple([self.cards_in_deck[i] for i in iterAllCards()]), 
-            tuple([player.mutableHash(verbose) for player in self.players]), 
-            tuple([tuple([sC and sC.mutableHash(verbose) for sC in row]) for row in self.public_zone]),
-        )
-        if verbose:
-            for i, e in enumerate(t):
-                print(i, deterministicHash(e))
-        return deterministicHash(t)
+    # Indices below are not on the wire. 
+    # Mutate players and selections via the methods, or call `reindex()`. 
+    player_index: tp.Dict[str, Player] = field(init=False, repr=False)
+    selections: tp.Dict[str, tp.Set[SmartCard]] = field(init=False, repr=False)
+    card_slots: tp.Dict[SmartCard, Slot] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.reindex()
+    
+    def reindex(self):
+        '''
+        Rebuilds all indices from scratch, dropping selections by 
+        players who are no longer present.  
+        '''
+        self.player_index = {player.uuid: player for player in self.players}
+        self.selections = {uuid: set() for uuid in self.player_index}
+        self.card_slots = {}
+        for y, row in enumerate(self.public_zone):
+            for x, card in enumerate(row):
+                if card is not None:
+                    self.card_slots[card] = Slot(None, y, x)
+        for player in self.players:
+            for x, card in enumerate(player.display_case):
+                if card is not None:
+                    self.card_slots[card] = Slot(player.uuid, 0, x)
+        for card in self.card_slots:
+            card.selected_by = [
+                uuid for uuid in card.selected_by if uuid in self.player_index
+            ]
+            for uuid in card.selected_by:
+                self.selections[uuid].add(card)
 
     @staticmethod
     def fullDeck():
-        return dict.fromkeys(iterAllCards(), True)
+        return FULL_DECK_MASK
     
     @classmethod
     def default(cls):
         return cls(
-            cards_in_deck=cls.fullDeck(), 
+            deck_mask=cls.fullDeck(), 
             players=[], 
             public_zone=[[None] * 4 for _ in range(3)], 
         )
@@ -138,32 +150,22 @@ class Gamestate:
     def validate(self):
         # if self.uniqueShoutSetPlayer() is None:
         #     self.clearVoteAccept()
-        for card in self.AllSmartCards():
-            card.selected_by = self.filterByUsers(card.selected_by)
-    
-    def filterByUsers(self, uuids: tp.List[str]):
-        return [uuid for uuid in uuids if uuid in self.getUuids()]
+        self.reindex()
     
     def toPrimitive(self):
-        d = asdict(self)
-        cards_in_deck = []
-        for idx in iterAllCards():
-            cards_in_deck.append('t' if self.cards_in_deck[idx] else 'f')
-        d['cards_in_deck'] = cards_in_deck
-        d['players'] = [player.toPrimitive() for player in self.players]
-        d['public_zone'] = [[
-            card and card.toPrimitive() for card in row
-        ] for row in self.public_zone]
-        return d
+        return {
+            'cards_in_deck': format(self.deck_mask, 'x'), 
+            'players': [player.toPrimitive() for player in self.players], 
+            'public_zone': [[
+                card and card.toPrimitive() for card in row
+            ] for row in self.public_zone], 
+        }
     
     @classmethod
     def fromPrimitive(cls, d: dict):
         try:
-            cards_in_deck: tp.Dict[tp.Tuple[int, int, int, int], bool] = {}
-            for idx, char in zip(iterAllCards(), d['cards_in_deck']):
-                cards_in_deck[idx] = char == 't'
             return cls(
-                cards_in_deck=cards_in_deck, 
+                deck_mask=int(d['cards_in_deck'], 16), 
                 players=[Player.fromPrimitive(player) for player in d['players']], 
                 public_zone=[[
                     card and SmartCard.fromPrimitive(card) for card in row
@@ -174,10 +176,83 @@ class Gamestate:
             raise
     
     def seekPlayer(self, uuid: str):
-        for player in self.players:
-            if player.uuid == uuid:
-                return player
-        raise KeyError(f'{uuid} not present')
+        try:
+            return self.player_index[uuid]
+        except KeyError:
+            raise KeyError(f'{uuid} not present')
+    
+    def addPlayer(self, player: Player):
+        self.players.append(player)
+        self.player_index[player.uuid] = player
+        self.selections[player.uuid] = set()
+        for x, card in enumerate(player.display_case):
+            if card is not None:
+                self.card_slots[card] = Slot(player.uuid, 0, x)
+    
+    def removePlayer(self, uuid: str):
+        player = self.player_index.pop(uuid)
+        self.players.remove(player)
+        self.clearSelections(uuid)
+        del self.selections[uuid]
+        self.clearDisplayCase(player)
+    
+    def selectedBy(self, uuid: str) -> tp.AbstractSet[SmartCard]:
+        return self.selections.get(uuid, NO_SELECTION)
+    
+    def toggleSelection(self, card: SmartCard, uuid: str):
+        card.toggle(uuid)
+        if uuid in card.selected_by:
+            self.selections[uuid].add(card)
+        else:
+            self.selections[uuid].discard(card)
+    
+    def clearSelections(self, uuid: str):
+        selection = self.selections[uuid]
+        for card in selection:
+            card.selected_by.remove(uuid)
+        selection.clear()
+    
+    def unselectAll(self, card: SmartCard):
+        for uuid in card.selected_by:
+            self.selections[uuid].discard(card)
+        card.selected_by.clear()
+    
+    def slotOf(self, card: SmartCard):
+        return self.card_slots[card]
+    
+    def putCard(self, slot: Slot, card: SmartCard):
+        if slot.owner is None:
+            self.public_zone[slot.y][slot.x] = card
+        else:
+            self.player_index[slot.owner].display_case[slot.x] = card
+        self.card_slots[card] = slot
+    
+    def takeCard(self, slot: Slot):
+        '''
+        Empties the slot. The card keeps its selections.  
+        '''
+        if slot.owner is None:
+            row = self.public_zone[slot.y]
+        else:
+            row = self.player_index[slot.owner].display_case
+        card = row[slot.x]
+        assert card is not None
+        row[slot.x] = None
+        del self.card_slots[card]
+        return card
+    
+    def clearDisplayCase(self, player: Player):
+        '''
+        Discards the cards in the display case. Returns how many there were.  
+        '''
+        n_cards = 0
+        for card in player.display_case:
+            if card is not None:
+                self.unselectAll(card)
+                del self.card_slots[card]
+                n_cards += 1
+        player.display_case = Player.newDisplayCase()
+        return n_cards
     
     def getUuids(self):
         return [player.uuid for player in self.players]
@@ -199,16 +274,26 @@ class Gamestate:
     
     def printDebug(self, file=sys.stdout):
         print('Gamestate:', file=file)
-        print('hash', self.mutableHash(
-            # verbose=True, 
-        ), file=file)
         pprint(self, stream=file)
     
     def isCardSelectionEqual(self, other: Gamestate):
         for a, b in zip(self.AllSmartCards(), other.AllSmartCards()):
-            if a.card != b.card or a.selected_by != b.selected_by:
+            if a.card_id != b.card_id or a.selected_by != b.selected_by:
                 return False
         return True
     
+    def isInDeck(self, card_id: int):
+        return self.deck_mask >> card_id & 1 == 1
+    
+    def removeFromDeck(self, card_id: int):
+        self.deck_mask &= ~(1 << card_id)
+    
+    def iterDeck(self):
+        mask = self.deck_mask
+        while mask:
+            low_bit = mask & -mask
+            yield low_bit.bit_length() - 1
+            mask ^= low_bit
+    
     def nCardsInDeck(self):
-        return sum(1 for v in self.cards_in_deck.values() if v)
+        return self.deck_mask.bit_count()
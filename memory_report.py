@@ -0,0 +1,189 @@
+'''
+Memory accounting of a running server, from tracemalloc snapshots.
+Each allocation is charged to the first subsystem in `Accountant.rules`
+that any frame of its traceback falls in, so e.g. a gamestate deep-copied
+into the undo tape counts as undo tape, not as gamestate.
+tracemalloc slows the server down, and a report blocks the event loop
+for as long as it takes (printed at the end), so this is off by default.
+See `MEMORY_REPORT_ENABLED` in server.py.
+'''
+
+from __future__ import annotations
+
+import typing as tp
+import os
+import sys
+import time
+import inspect
+import asyncio
+import tracemalloc
+from collections import deque
+
+if tp.TYPE_CHECKING:
+    from server import Server
+
+N_FRAMES = 32   # deep enough to reach the server code from inside the stdlib
+# A subsystem is flagged when it grew in each of this many reports in a row ...
+GROWTH_STREAK = 3
+# ... by at least this much in total.
+GROWTH_MIN = 256 * 1024 # bytes
+
+OTHER = 'other'
+
+class Rule(tp.NamedTuple):
+    subsystem: str
+    filename: str
+    first_line: int
+    last_line: int
+
+def ruleOf(subsystem: str, obj: tp.Any):
+    lines, first_line = inspect.getsourcelines(obj)
+    return Rule(
+        subsystem, os.path.abspath(inspect.getsourcefile(obj)),  # type: ignore
+        first_line, first_line + len(lines) - 1,
+    )
+
+def fileRule(subsystem: str, filename: str):
+    return Rule(subsystem, os.path.abspath(filename), 0, sys.maxsize)
+
+def formatSize(n_bytes: float):
+    for unit in ('B', 'KB', 'MB'):
+        if abs(n_bytes) < 1024:
+            return f'{n_bytes:.0f} {unit}' if unit == 'B' else f'{n_bytes:.1f} {unit}'
+        n_bytes /= 1024
+    return f'{n_bytes:.1f} GB'
+
+class Accountant:
+    def __init__(self, server: Server):
+        self.server = server
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(N_FRAMES)
+        # The class may live in `__main__`, so don't import it by name.
+        module = sys.modules[type(server).__module__]
+        import gamestate
+        import shared
+        self.rules = [
+            ruleOf('undo tape', module.UndoTape),
+            ruleOf('texture cache', module.prepareTexture),
+            ruleOf('texture cache', module.Server.getTexture),
+            fileRule('connection buffers', asyncio.streams.__file__),
+            fileRule('connection buffers', asyncio.selector_events.__file__),
+            ruleOf('connection buffers', shared.primitiveToPayload),
+            ruleOf('connection buffers', module.Server.gamestatePacket),
+            fileRule('gamestate', gamestate.__file__),
+            ruleOf('gamestate', module.Dealer),
+            ruleOf('gamestate', module.Server.applyEvent),
+            ruleOf('gamestate', module.Server.onPlayerJoin),
+            ruleOf('gamestate', module.Server.onPlayerLeave),
+        ]
+        self.subsystems = [*dict.fromkeys(rule.subsystem for rule in self.rules), OTHER]
+        # filename -> [(first_line, last_line, priority)], so that each 
+        # traceback is walked once rather than once per rule
+        self.spans: tp.Dict[str, tp.List[tp.Tuple[int, int, int]]] = {}
+        for priority, rule in enumerate(self.rules):
+            self.spans.setdefault(rule.filename, []).append(
+                (rule.first_line, rule.last_line, priority), 
+            )
+        # Allocations made by the accounting itself
+        self.ignored = {tracemalloc.__file__, __file__}
+        self.cache: tp.Dict[tracemalloc.Traceback, str | None] = {}
+        self.history: deque[tp.Dict[str, int]] = deque(maxlen=GROWTH_STREAK + 1)
+
+    def classify(self, traceback: tracemalloc.Traceback):
+        frames = [*traceback]
+        if frames[-1].filename in self.ignored:
+            subsystem = None
+        else:
+            best = len(self.rules)
+            for frame in frames:
+                for first_line, last_line, priority in self.spans.get(frame.filename, ()):
+                    if priority < best and first_line <= frame.lineno <= last_line:
+                        best = priority
+            subsystem = OTHER if best == len(self.rules) else self.rules[best].subsystem
+        return subsystem
+
+    def take(self):
+        '''
+        Bytes currently allocated, per subsystem.
+        '''
+        snapshot = tracemalloc.take_snapshot()
+        sizes = dict.fromkeys(self.subsystems, 0)
+        # Only the tracebacks still allocating are kept, so that the cache 
+        # doesn't grow for as long as the server runs. 
+        cache, self.cache = self.cache, {}
+        for stat in snapshot.statistics('traceback'):
+            try:
+                subsystem = cache[stat.traceback]
+            except KeyError:
+                subsystem = self.classify(stat.traceback)
+            self.cache[stat.traceback] = subsystem
+            if subsystem is not None:
+                sizes[subsystem] += stat.size
+        self.history.append(sizes)
+        return sizes
+
+    def growing(self):
+        '''
+        {subsystem: growth} over the last `GROWTH_STREAK` reports, for
+        those that grew in every one of them.
+        '''
+        if len(self.history) <= GROWTH_STREAK:
+            return {}
+        history = [*self.history]
+        result = {}
+        for subsystem in self.subsystems:
+            sizes = [h[subsystem] for h in history]
+            growth = sizes[-1] - sizes[0]
+            if growth >= GROWTH_MIN and all(
+                a < b for a, b in zip(sizes, sizes[1:])
+            ):
+                result[subsystem] = growth
+        return result
+
+    def notes(self):
+        # What the numbers are made of, straight from the server.
+        server = self.server
+        buffered = 0
+        for writer in server.writers.values():
+            try:
+                buffered += writer.transport.get_write_buffer_size()
+            except AttributeError:
+                pass
+        return {
+            'undo tape': f'{len(server.undoTape.tape)} states',
+            'texture cache': formatSize(len(server.texture or b'')) + ' gzipped',
+            'connection buffers': (
+                f'{len(server.writers)} clients, {formatSize(buffered)} unsent'
+            ),
+            'gamestate': f'{len(server.gamestate.card_slots)} cards on the table',
+        }
+
+    def report(self, file=sys.stdout):
+        start = time.perf_counter()
+        previous = self.history[-1] if self.history else None
+        sizes = self.take()
+        traced, peak = tracemalloc.get_traced_memory()
+        notes = self.notes()
+        print(
+            f'[memory] {formatSize(traced)} traced, peak {formatSize(peak)}',
+            file=file,
+        )
+        for subsystem, size in sizes.items():
+            delta = '' if previous is None else formatSize(size - previous[subsystem])
+            print(
+                f'  {subsystem:<20}{formatSize(size):>10}{delta:>12}'
+                f'   {notes.get(subsystem, "")}',
+                file=file,
+            )
+        for subsystem, growth in self.growing().items():
+            print(
+                f'  Warning: {subsystem} grew in each of the last '
+                f'{GROWTH_STREAK} reports, by {formatSize(growth)} in total',
+                file=file,
+            )
+        print(f'  ({(time.perf_counter() - start) * 1000:.0f} ms)', file=file)
+
+    async def run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.report()
@@ -0,0 +1,104 @@
+'''
+Client-side prediction.
+The client applies some of its own events locally right away, and
+re-applies the ones the server has not acknowledged yet on top of
+every authoritative gamestate. Mispredictions are thus rolled back
+by the next broadcast.
+'''
+
+from __future__ import annotations
+
+import typing as tp
+import math
+import copy
+
+from shared import *
+from shared import ClientEventType as CET, ClientEventField as CEF
+from gamestate import *
+
+PREDICTED_EVENTS = {
+    CET.TOGGLE_SELECT_CARD_PUBLIC,
+    CET.TOGGLE_SELECT_CARD_DISPLAY,
+    CET.CALL_SET,
+    CET.CANCEL_CALL_SET,
+    CET.CLEAR_MY_SELECTIONS,
+}
+
+# Only the server knows how long the call took.
+PREDICTED_SHOUT = math.inf
+
+def predict(gamestate: Gamestate, uuid: str, event: tp.Dict):
+    '''
+    Mirrors the `Server` handlers of `PREDICTED_EVENTS`.
+    Events that would not apply cleanly are ignored.
+    '''
+    type_ = CET(event[CEF.TYPE])
+    try:
+        myself = gamestate.seekPlayer(uuid)
+    except KeyError:
+        return
+    if type_ == CET.TOGGLE_SELECT_CARD_PUBLIC:
+        y, x = event[CEF.TARGET_VALUE]
+        try:
+            card = gamestate.public_zone[y][x]
+        except IndexError:
+            return
+        if card is None:
+            return
+        gamestate.toggleSelection(card, uuid)
+        gamestate.clearVoteAccept()
+    elif type_ == CET.TOGGLE_SELECT_CARD_DISPLAY:
+        try:
+            player = gamestate.seekPlayer(event[CEF.TARGET_PLAYER])
+            card = player.display_case[event[CEF.TARGET_VALUE]]
+        except (KeyError, IndexError):
+            return
+        if card is None:
+            return
+        gamestate.toggleSelection(card, uuid)
+        gamestate.clearVoteAccept()
+    elif type_ == CET.CALL_SET:
+        myself.shouted_set = PREDICTED_SHOUT
+        gamestate.clearVoteAccept()
+    elif type_ == CET.CANCEL_CALL_SET:
+        myself.shouted_set = None
+        gamestate.clearVoteAccept()
+    elif type_ == CET.CLEAR_MY_SELECTIONS:
+        gamestate.clearSelections(uuid)
+    else:
+        raise ValueError(f'Not a predicted event: {type_}')
+
+class Predictor:
+    def __init__(self, uuid: str, authoritative: Gamestate):
+        self.uuid = uuid
+        self.authoritative = authoritative
+        self.predicted = authoritative
+        self.pending: tp.List[tp.Dict] = []
+        self.next_seq = 1
+
+    def submit(self, event: tp.Dict):
+        '''
+        Tags `event` with a sequence number if it is predicted, and
+        applies it to `self.predicted`.
+        '''
+        if CET(event[CEF.TYPE]) not in PREDICTED_EVENTS:
+            return False
+        event[CEF.SEQ] = self.next_seq
+        self.next_seq += 1
+        self.pending.append(event)
+        if self.predicted is self.authoritative:
+            # never mutate what the server sent
+            self.predicted = copy.deepcopy(self.authoritative)
+        predict(self.predicted, self.uuid, event)
+        return True
+
+    def reconcile(self, authoritative: Gamestate, acked_seq: int):
+        self.authoritative = authoritative
+        self.pending = [e for e in self.pending if e[CEF.SEQ] > acked_seq]
+        if self.pending:
+            self.predicted = copy.deepcopy(authoritative)
+            for event in self.pending:
+                predict(self.predicted, self.uuid, event)
+        else:
+            self.predicted = authoritative
+        return self.predicted
@@ -1,19 +1,68 @@
 #!/usr/bin/env -S uv run
 
-import cairosvg
+'''
+Rasterizes the SVG sheet into `PNG`.  
+`TEXTURE_MANIFEST` records what the PNG was rendered from, so an 
+up-to-date PNG is never rendered again.  
+'''
+
+import os
+import sys
+import json
+import hashlib
 
 from shared import *
 from env_wrap import *
 
-def main():
-    print('Rasterizing texture...')
+def wantedManifest():
+    with open(SVG, 'rb') as f:
+        svg_sha256 = hashlib.sha256(f.read()).hexdigest()
+    return dict(
+        svg_sha256=svg_sha256, 
+        resolution=[
+            CARD_TEXTURE_RESOLUTION[0] * DECK.sheet_shape[0], 
+            CARD_TEXTURE_RESOLUTION[1] * DECK.sheet_shape[1], 
+        ], 
+    )
+
+def isUpToDate(manifest: tp.Dict):
+    if not os.path.isfile(PNG):
+        return False
+    try:
+        with open(TEXTURE_MANIFEST, 'r') as f:
+            return json.load(f) == manifest
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+
+def rasterize(force: bool = False):
+    '''
+    Returns whether it had to render.  
+    '''
+    manifest = wantedManifest()
+    if not force and isUpToDate(manifest):
+        return False
+    import cairosvg     # needs Cairo, which clients don't
+    os.makedirs(os.path.dirname(PNG), exist_ok=True)
+    width, height = manifest['resolution']
+    # Render aside, so a crash never leaves a half-written PNG behind.
+    temp = os.path.splitext(PNG)[0] + '.part.png'
     cairosvg.svg2png(
-        url=SVG, write_to=PNG, 
-        output_width =CARD_TEXTURE_RESOLUTION[0] * 9, 
-        output_height=CARD_TEXTURE_RESOLUTION[1] * 9, 
+        url=SVG, write_to=temp, 
+        output_width =width, 
+        output_height=height, 
         dpi=1,  # small dpi fixes repeated <pattern> interpolation
     )
-    print('ok')
+    os.replace(temp, PNG)
+    with open(TEXTURE_MANIFEST, 'w') as f:
+        json.dump(manifest, f)
+    return True
+
+def main():
+    print('Rasterizing texture...')
+    if rasterize(force='--force' in sys.argv):
+        print('ok')
+    else:
+        print('Up to date. Pass --force to render anyway.')
 
 if __name__ == "__main__":
     main()
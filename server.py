@@ -11,7 +11,13 @@ import copy
 import io
 import traceback
 import gzip
-from functools import cached_property
+import heapq
+import math
+import os
+import signal
+import contextlib
+from concurrent.futures import Executor, ThreadPoolExecutor
+from enum import Enum
 
 from uuid import uuid4
 
@@ -21,20 +27,97 @@ from shared import (
     ClientEventType as CET, ClientEventField as CEF, 
 )
 from gamestate import *
+from analytics import AnalyticsWriter, Kind
 
-class HashMismatchError(Exception): pass
+# Gamestate broadcasts are coalesced to at most one per this many seconds. 
+# 0 broadcasts after every event. 
+BROADCAST_TICK = 0.0
+
+# Record game events to ./logs/analytics/ for `analytics.py`. 
+ANALYTICS_ENABLED = True
+
+# Where gamestate packets are JSON-dumped and gzipped: 'thread', 'process', 
+# or None to always do it on the event loop. None until an executor shows a 
+# gain in `benchmark.py encode`. 
+ENCODE_EXECUTOR: tp.Literal['thread', 'process'] | None = None
+# Gamestates with fewer cards on the table are still encoded inline. 
+ENCODE_OFFLOAD_MIN_CARDS = 40
+
+# Account memory per subsystem with tracemalloc, which slows the server down. 
+# A report prints on SIGUSR1, and every `MEMORY_REPORT_INTERVAL` seconds 
+# unless that is None. See `memory_report.py`. 
+MEMORY_REPORT_ENABLED = False
+MEMORY_REPORT_INTERVAL: float | None = 600.0
+
+# Token buckets per client, per event class: (events per second, burst). 
+# Every event in a BATCH counts. Classes missing here are not limited, and 
+# `rate_limits=None` turns limiting off. An event over the limit is dropped, 
+# and the server stops reading from that client until it may send again. 
+RATE_LIMITS: tp.Dict[str, tp.Tuple[float, float]] = {
+    'deal': (5.0, 10), 
+    'select': (20.0, 40), 
+    'speak': (1.0, 5), 
+    'ping': (5.0, 10), 
+    'other': (10.0, 30), 
+}
+RATE_CLASSES = {
+    CET.DEAL_CARD: 'deal', 
+    CET.DEAL_CARDS: 'deal', 
+    CET.DEAL_TO_FILL: 'deal', 
+    CET.TOGGLE_SELECT_CARD_PUBLIC: 'select', 
+    CET.TOGGLE_SELECT_CARD_DISPLAY: 'select', 
+    CET.CLEAR_MY_SELECTIONS: 'select', 
+    CET.SPEAK: 'speak', 
+    CET.PING: 'ping', 
+}   # anything else: 'other'
+# At most one warning per event class per this many seconds
+RATE_WARNING_INTERVAL = 5.0 # sec
+# Disconnect a client throttled for this long, without a break of 
+# `RATE_WARNING_INTERVAL`. Its backlog would take forever to read. 
+RATE_KICK_AFTER: float | None = 30.0 # sec
+
+# These broadcast right away even when ticking. 
+FLUSH_NOW_EVENTS = {CET.CALL_SET, CET.CANCEL_CALL_SET, CET.TAKE, CET.VOTE}
+
+# (target player uuid, or None for everyone; payload)
+Outbox = tp.List[tp.Tuple[str | None, bytes]]
+
+class StateField(str, Enum):
+    CARDS = 'cards'             # cards taken out of the public zone or display cases
+    SELECTION = 'selection'     # per player, keyed with the uuid
+    SHOUTS = 'shouts'
+    TAPE = 'undo tape'
+
+VersionKey = StateField | tp.Tuple[StateField, str]
+
+class StaleEventError(Exception): pass
 class JustWarnSourceUser(Exception): pass
+class TextureUnavailable(Exception): pass
+class Throttled(JustWarnSourceUser):
+    def __init__(self, message: str, warn: bool, kick: bool, retry_after: float):
+        super().__init__(message)
+        self.warn = warn
+        self.kick = kick
+        self.retry_after = retry_after
 class UndoToFuture(Exception): 
     # More precisely: trying to undo to a UUID not present in the current timeline.
     pass
 
+class Memory(tp.NamedTuple):
+    # A gamestate without its indices, which are most of its size. 
+    deck_mask: int
+    players: tp.List[Player]
+    public_zone: tp.List[tp.List[SmartCard | None]]
+
 class UndoTape:
     def __init__(self, max_size: int = 64):
         self.max_size = max_size
-        self.tape: tp.List[tp.Tuple[str, Gamestate]] = []
+        self.tape: tp.List[tp.Tuple[str, Memory]] = []
     
     def recordNewState(self, gamestate: Gamestate):
-        self.tape.append((str(uuid4()), copy.deepcopy(gamestate)))
+        self.tape.append((str(uuid4()), copy.deepcopy(Memory(
+            gamestate.deck_mask, gamestate.players, gamestate.public_zone, 
+        ))))
         if len(self.tape) > self.max_size:
             self.tape.pop(0)
     
@@ -47,14 +130,16 @@ class UndoTape:
         while True:
             uuid, memory = self.forceUndo(players_uuid)
             if uuid == to_uuid:
-                return memory
+                # A copy: memories stay as recorded, e.g. for a batch 
+                # that rolls back the undo. The constructor reindexes. 
+                return Gamestate(*copy.deepcopy(memory))
     
     def forceUndo(self, players_uuid: tp.List[str]):
         try:
             uuid, memory = self.tape[-1]
         except IndexError:
             raise JustWarnSourceUser('undo failed --- tape is empty')
-        if memory.getUuids() != players_uuid:
+        if [player.uuid for player in memory.players] != players_uuid:
             raise JustWarnSourceUser('undo failed --- undo past player join/leave is not supported')
         self.tape.pop()
         return uuid, memory
@@ -65,36 +150,336 @@ class UndoTape:
         except IndexError:
             return 'START OF TAPE'
 
+class Check(tp.NamedTuple):
+    '''
+    A schema entry that also checks the value, against the gamestate 
+    and the rest of the event.  
+    '''
+    types: type | tp.Tuple[type, ...]
+    valid: tp.Callable[[Server, tp.Any, dict], bool]
+    what: str   # for the warning, e.g. 'a slot of the public zone'
+
+# field -> the type its value must have
+Schema = tp.Dict[CEF, type | tp.Tuple[type, ...] | Check]
+
+def isIndex(value: tp.Any, n: int):
+    # `bool` is an `int`, and negative indices count from the end. Neither.
+    return type(value) is int and 0 <= value < n
+
+def isPublicSlot(server: Server, value: tp.Any, event: dict):
+    zone = server.gamestate.public_zone
+    return (
+        len(value) == 2 and isIndex(value[0], len(zone)) and 
+        isIndex(value[1], len(zone[value[0]]))
+    )
+
+def isPlayer(server: Server, value: tp.Any, event: dict):
+    return value in server.gamestate.player_index
+
+def isDisplaySlot(server: Server, value: tp.Any, event: dict):
+    # The target player is checked first.
+    player = server.gamestate.seekPlayer(event[CEF.TARGET_PLAYER])
+    return isIndex(value, len(player.display_case))
+
+def isVote(server: Server, value: tp.Any, event: dict):
+    return value in Vote._value2member_map_
+
+def isInt(server: Server, value: tp.Any, event: dict):
+    return type(value) is int   # not a `bool`
+
+def isPairOfInts(server: Server, value: tp.Any, event: dict):
+    return len(value) == 2 and all(type(x) is int for x in value)
+
+def isDealable(server: Server, value: tp.Any, event: dict):
+    dealer = server.dealer
+    return type(value) is int and 1 <= value <= min(dealer.nVacancies(), len(dealer.pool))
+
+PLAYER = Check(str, isPlayer, 'a player at this table')
+INT = Check(int, isInt, 'an integer')
+
+class Handler(tp.NamedTuple):
+    '''
+    How `Server.applyEvent` dispatches one client event type.  
+    `apply` returns the touched version keys, or None if nothing happened.  
+    '''
+    apply: tp.Callable[[Server, str, Player, dict, Outbox], tp.Tuple[VersionKey, ...] | None]
+    schema: Schema
+    mutates: bool       # bumps the gamestate version
+    broadcast: bool     # the gamestate goes out afterwards
+    checks: tp.Tuple[VersionKey, ...]  # compare-and-set before `apply`
+    log: bool
+
+HANDLERS: tp.Dict[CET, Handler] = {}
+
+def handles(
+    type_: CET, schema: Schema | None = None, *, 
+    mutates: bool = True, broadcast: bool = True, 
+    checks: tp.Tuple[VersionKey, ...] = (), log: bool = True, 
+):
+    def decorate(apply):
+        HANDLERS[type_] = Handler(
+            apply, schema or {}, mutates, broadcast, checks, log, 
+        )
+        return apply
+    return decorate
+
+def mutates(event: dict):
+    # Unknown types count as mutating. `applyEvent` rejects them anyway. 
+    try:
+        return HANDLERS[CET(event.get(CEF.TYPE))].mutates
+    except (KeyError, ValueError):
+        return True
+
+PONG_PAYLOAD = primitiveToPayload({ SEF.TYPE: SET.PONG })
+
+# (event type, seconds spent in its handler)
+TimingHook = tp.Callable[[CET, float], None]
+
+class Snapshot(tp.NamedTuple):
+    # Whatever events mutate, for rolling back a batch. 
+    gamestate: Gamestate
+    tape: tp.List[tp.Tuple[str, Memory]]
+    dealer: Dealer
+    version: int
+    field_versions: tp.Dict[VersionKey, tp.Tuple[int, str | None]]
+    epoch: tp.Tuple[int, str | None]
+    time_of_last_harvest: float
+
+class Dealer:
+    '''
+    Server-side index for dealing without scanning: a shuffled pool of 
+    the card ids left in the deck, and a heap of the vacant public-zone 
+    slots in row-major order.  
+    Rebuild it whenever the gamestate is replaced or the zone reshaped.  
+    '''
+    def __init__(self, gamestate: Gamestate):
+        self.rebuild(gamestate)
+    
+    def rebuild(self, gamestate: Gamestate):
+        self.pool = [*gamestate.iterDeck()]
+        random.shuffle(self.pool)
+        # row-major order is already a valid heap
+        self.vacancies: tp.List[tp.Tuple[int, int]] = [
+            (y, x) 
+            for y, row in enumerate(gamestate.public_zone)
+            for x, card in enumerate(row) if card is None
+        ]
+    
+    def vacate(self, y: int, x: int):
+        heapq.heappush(self.vacancies, (y, x))
+    
+    def nVacancies(self):
+        return len(self.vacancies)
+    
+    def deal(self, gamestate: Gamestate, n: int):
+        '''
+        Deals up to `n` cards into the first vacant slots.  
+        Returns how many were dealt.  
+        '''
+        now = time.time()
+        n_dealt = 0
+        while n_dealt < n and self.pool and self.vacancies:
+            y, x = heapq.heappop(self.vacancies)
+            card_id = self.pool.pop()
+            gamestate.removeFromDeck(card_id)
+            gamestate.putCard(Slot(None, y, x), SmartCard(card_id, now))
+            n_dealt += 1
+        return n_dealt
+
+def subEventsOf(event: tp.Any) -> tp.List[dict]:
+    # Malformed ones left out. `handleEvent` complains about them. 
+    if not isinstance(event, dict):
+        return []
+    events = event.get(CEF.EVENTS) if event.get(CEF.TYPE) == CET.BATCH else None
+    if not isinstance(events, list):
+        return [event]
+    return [sub_event for sub_event in events if isinstance(sub_event, dict)]
+
+def seqsOf(events: tp.List[dict]) -> tp.List[int]:
+    # The SEQs of the events the client predicted. 
+    seqs = [sub_event[CEF.SEQ] for sub_event in events if CEF.SEQ in sub_event]
+    if not all(type(seq) is int for seq in seqs):
+        raise JustWarnSourceUser('Malformed event: bad seq')
+    return seqs
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        # To block a class, leave the event type out of the protocol instead. 
+        if not rate > 0 or not burst >= 1:
+            raise ValueError(f'Bad rate limit: {rate} / sec, burst {burst}')
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+    
+    def refill(self, now: float):
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.last_refill) * self.rate, 
+        )
+        self.last_refill = now
+
+class RateLimiter:
+    '''
+    One per client.  
+    '''
+    def __init__(self, limits: tp.Dict[str, tp.Tuple[float, float]]):
+        self.buckets = {
+            class_: TokenBucket(rate, burst) 
+            for class_, (rate, burst) in limits.items()
+        }
+        self.last_warnings: tp.Dict[str, float] = {}
+        self.throttled_since = 0.0
+        self.last_drop = -math.inf
+    
+    def admit(self, event: tp.Any):
+        '''
+        Takes tokens for `event`, or for every event of a batch, all or 
+        nothing. Raises `Throttled` if some class ran dry.  
+        '''
+        needs: tp.Dict[str, int] = {}
+        for sub_event in subEventsOf(event):
+            type_ = sub_event.get(CEF.TYPE)
+            # unhashable garbage included. `handleEvent` complains about it. 
+            class_ = RATE_CLASSES.get(type_, 'other') if isinstance(type_, str) else 'other'
+            needs[class_] = needs.get(class_, 0) + 1
+        now = time.monotonic()
+        dry = []
+        retry_after = 0.0
+        for class_, n in needs.items():
+            bucket = self.buckets.get(class_)
+            if bucket is None:
+                continue
+            bucket.refill(now)
+            if bucket.tokens < n:
+                dry.append(class_)
+                # A batch larger than the burst never fits. Wait for a full bucket.
+                retry_after = max(
+                    retry_after, (min(n, bucket.burst) - bucket.tokens) / bucket.rate, 
+                )
+        if dry:
+            if now - self.last_drop > RATE_WARNING_INTERVAL:
+                self.throttled_since = now
+            self.last_drop = now
+            if (
+                RATE_KICK_AFTER is not None and 
+                now - self.throttled_since >= RATE_KICK_AFTER
+            ):
+                raise Throttled(
+                    f'Disconnected: too many {" / ".join(dry)} events for too long.', 
+                    True, True, retry_after, 
+                )
+            warn = False
+            for class_ in dry:
+                if now - self.last_warnings.get(class_, -math.inf) >= RATE_WARNING_INTERVAL:
+                    self.last_warnings[class_] = now
+                    warn = True
+            raise Throttled(
+                f'Slow down! Too many {" / ".join(dry)} events. '
+                'Some of your clicks were dropped.', warn, False, retry_after, 
+            )
+        for class_, n in needs.items():
+            bucket = self.buckets.get(class_)
+            if bucket is not None:
+                bucket.tokens -= n
+
 class Server:
-    def __init__(self):
-        self.port = int(input('Port > '))
+    def __init__(
+        self, port: int, broadcast_tick: float = BROADCAST_TICK, 
+        analytics: bool = ANALYTICS_ENABLED, 
+        encode_executor: tp.Literal['thread', 'process'] | None = ENCODE_EXECUTOR, 
+        memory_report: bool = MEMORY_REPORT_ENABLED, 
+        table: str | None = None,   # None: the only table, whatever clients ask for
+        rate_limits: tp.Dict[str, tp.Tuple[float, float]] | None = RATE_LIMITS, 
+    ):
+        # First, so that tracemalloc sees everything allocated below. 
+        self.accountant = None
+        if memory_report:
+            from memory_report import Accountant
+            self.accountant = Accountant(self)
+        self.port = port
+        self.table = table
+        self.broadcast_tick = broadcast_tick
+        self.is_dirty = False
         self.gamestate = Gamestate.default()
         self.undoTape = UndoTape()
         self.undoTape.recordNewState(self.gamestate)
+        self.dealer = Dealer(self.gamestate)
         self.writers: tp.Dict[str, StreamWriter] = {}
+        self.acks: tp.Dict[str, int] = {}
         self.time_of_last_harvest = time.time()
+        # Monotonic gamestate version, bumped on every change. 
+        self.version = 0
+        # For versioned events: when, and by whom, each field last changed. 
+        self.field_versions: tp.Dict[VersionKey, tp.Tuple[int, str | None]] = {}
+        self.epoch: tp.Tuple[int, str | None] = (0, None)   # everything changed
+        # gzipped PNG. Left None, `start` prepares it in the background. 
+        self.texture: bytes | None = None
+        self.textureTask: asyncio.Task[bytes] | None = None
+        self.analytics = AnalyticsWriter(
+            str(port) if table is None else table, 
+        ) if analytics else None
+        self.analyticsFlushes: tp.Set[asyncio.Task] = set()
+        # One worker, so that packets come out in the order they were taken. 
+        self.encodeExecutor: Executor | None = {
+            'thread': lambda: ThreadPoolExecutor(1, thread_name_prefix='encoder'), 
+            'process': processPool, 
+            None: lambda: None, 
+        }[encode_executor]()
+        self.timing_hooks: tp.List[TimingHook] = []
+        # Held from encoding a gamestate packet to writing it, so that an 
+        # inline packet can't overtake an offloaded one. 
+        self.gamestateLock = asyncio.Lock()
+        if rate_limits is not None:
+            RateLimiter(rate_limits)    # fails here rather than on each client
+        self.rate_limits = rate_limits
 
     async def handleClient(self, reader: StreamReader, writer: StreamWriter):
+        if await acceptHandshake(reader, writer) is not None:
+            await self.serveClient(reader, writer)
+
+    async def serveClient(self, reader: StreamReader, writer: StreamWriter):
+        '''
+        The rest of a connection, once it handshook.  
+        '''
         addr = writer.get_extra_info('peername')
-        print(f'New connection from {addr}')
-        try:
-            handshake = await recvPrimitive(reader)
-        except Exception as e:
-            handshake = None
-            print(f'Someone didn\'t handshake and caused {e}. Duh.')
-        if handshake != HANDSHAKE:
-            print(f'Handshake failed for {addr} --- expected {HANDSHAKE}, got {handshake}')
-            writer.close()
-            return
         uuid = str(uuid4())
         print(f'Assigning UUID {uuid[:4]}')
-        await self.onPlayerJoin(uuid, writer)
+        limiter = None if self.rate_limits is None else RateLimiter(self.rate_limits)
         
         try:
+            try:
+                await self.onPlayerJoin(uuid, writer)
+            except (
+                BrokenPipeError, 
+                ConnectionAbortedError, ConnectionResetError, 
+                TimeoutError, 
+            ):
+                print(f'Client {uuid[:4]} disconnected while joining')
+                return
+            except TextureUnavailable:
+                print(f'Turning away {uuid[:4]}: no texture to serve')
+                return
             while True:
                 try:
                     event = await recvPrimitive(reader)
                     try:
+                        if not isinstance(event, dict):
+                            raise JustWarnSourceUser('Malformed event')
+                        if limiter is not None:
+                            try:
+                                limiter.admit(event)
+                            except Throttled as e:
+                                await self.onThrottled(uuid, event, writer, e)
+                                if e.kick:
+                                    print(f'Kicking {uuid[:4]} for flooding')
+                                    break
+                                # Backpressure: leave the rest in the socket. 
+                                await asyncio.sleep(e.retry_after)
+                                continue
+                        if event.get(CEF.TYPE) == CET.PING:
+                            # fast path: no lookup, no logging, no broadcast
+                            await sendPayload(PONG_PAYLOAD, writer)
+                            continue
                         await self.handleEvent(uuid, event)
                     except JustWarnSourceUser as e:
                         payload = self.popupPayload('Warning', str(e))
@@ -123,34 +508,109 @@ class Server:
                 pass
             print('ok')
 
-    async def start(self):
-        print(f'Starting server on port {self.port}...')
-        print('I\'m ready for client connections!')
-        server = await asyncio.start_server(self.handleClient, '', self.port)
+    async def start(self, listen: bool = True):
+        '''
+        With `listen=False`, clients come in through `serveClient` instead, 
+        e.g. from a `supervisor.Worker`.  
+        '''
+        if listen:
+            print(f'Starting server on port {self.port}...')
+            print('I\'m ready for client connections!')
+        else:
+            print(f'Opening table {self.table!r}...')
+        if self.texture is None and self.textureTask is None:
+            self.textureTask = asyncio.create_task(
+                asyncio.to_thread(prepareTexture), 
+            )
+            this = asyncio.current_task()
+            assert this is not None
+            self.textureTask.add_done_callback(
+                lambda task: onTextureFailed(task, this.cancel), 
+            )
+        server = None
+        if listen:
+            server = await asyncio.start_server(self.handleClient, '', self.port)
+        ticker = asyncio.create_task(self.ticker())
+        memoryReporter = None
+        if self.accountant is not None:
+            # One handler per process. Without `listen`, the process hosts 
+            # other tables too, and its owner installs it, e.g. `supervisor.Worker`. 
+            if listen and hasattr(signal, 'SIGUSR1'):
+                asyncio.get_running_loop().add_signal_handler(
+                    signal.SIGUSR1, self.accountant.report, 
+                )
+            if MEMORY_REPORT_INTERVAL is not None:
+                memoryReporter = asyncio.create_task(
+                    self.accountant.run(MEMORY_REPORT_INTERVAL), 
+                )
 
-        async with server:
+        async with server or contextlib.nullcontext():
             try:
-                await server.serve_forever()
+                if server is None:
+                    await asyncio.Event().wait()
+                else:
+                    await server.serve_forever()
             except asyncio.CancelledError:
                 print('server closing...')
+            finally:
+                ticker.cancel()
+                if memoryReporter is not None:
+                    memoryReporter.cancel()
+                if self.analytics is not None:
+                    await self.analytics.flushInThread()
+                # Handlers still closing encode inline from now on. 
+                encodeExecutor, self.encodeExecutor = self.encodeExecutor, None
+                if encodeExecutor is not None:
+                    encodeExecutor.shutdown()
         print('ok')
     
-    def gamestatePacket(self):
-        self.gamestate.validate()
-        return primitiveToPayload({
+    async def ticker(self):
+        if self.broadcast_tick <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.broadcast_tick)
+            if self.is_dirty:
+                await self.broadcastGamestate()
+    
+    async def requestBroadcast(self, flush_now: bool):
+        if flush_now or self.broadcast_tick <= 0:
+            await self.broadcastGamestate()
+        else:
+            self.is_dirty = True
+    
+    async def gamestatePacket(self):
+        # The snapshot is taken before any await, so later events can't leak in.
+        snapshot = {
             SEF.TYPE: SET.GAMESTATE,
             SEF.LAST_UNDO_UUID: self.undoTape.lastUUID(),
+            SEF.ACKS: {**self.acks}, 
+            SEF.VERSION: self.version, 
             SEF.CONTENT: self.gamestate.toPrimitive(), 
-        })
+        }
+        if (
+            self.encodeExecutor is None or 
+            len(self.gamestate.card_slots) < ENCODE_OFFLOAD_MIN_CARDS
+        ):
+            return primitiveToPayload(snapshot)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.encodeExecutor, primitiveToPayload, snapshot, 
+        )
 
     async def sendGamestate(
         self, writer: StreamWriter, cached_payload: bytes | None = None, 
     ):
-        await sendPayload(cached_payload or self.gamestatePacket(), writer)
+        if cached_payload is not None:
+            # From `broadcast`, whose callers hold `gamestateLock`.
+            await sendPayload(cached_payload, writer)
+            return
+        async with self.gamestateLock:
+            await sendPayload(await self.gamestatePacket(), writer)
     
     async def broadcastGamestate(self):
-        payload = self.gamestatePacket()
-        await self.broadcast(payload)
+        self.is_dirty = False
+        async with self.gamestateLock:
+            payload = await self.gamestatePacket()
+            await self.broadcast(payload)
         # re-encode gamestate for server-client hash consistency
         # self.gamestate = Gamestate.fromPrimitive(
         #     json.loads(json.dumps(
@@ -167,170 +627,384 @@ class Server:
                 continue
     
     async def onPlayerJoin(self, uuid: str, writer: StreamWriter):
+        self.gamestate.addPlayer(Player(
+            str(uuid), f'Player {len(self.gamestate.players)}', 
+            f'{random.randint(0, 100)},{random.randint(0, 100)},{random.randint(0, 100)}', 
+        ))
+        self.touch(uuid)
+        await self.broadcastGamestate()
         await sendPrimitive({
             SEF.TYPE: SET.YOU_ARE,
             SEF.CONTENT: uuid,
         }, writer)
-        await streamPayload(self.texture, writer)
+        # The gamestate goes before the texture, so the client can draw 
+        # a placeholder board while the texture downloads.  
+        await self.sendGamestate(writer)
+        await streamPayload(await self.getTexture(), writer)
+        # Only now, so that no broadcast interleaves with the texture. 
         self.writers[uuid] = writer
-        self.gamestate.players.append(Player(
-            str(uuid), f'Player {len(self.gamestate.players)}', 
-            f'{random.randint(0, 100)},{random.randint(0, 100)},{random.randint(0, 100)}', 
-        ))
-        await self.broadcastGamestate()
+        await self.sendGamestate(writer)
     
-    @cached_property
-    def texture(self):
-        try:
-            with open(PNG, 'rb') as f:
-                return gzip.compress(f.read())
-        except FileNotFoundError:
-            input('Hint: Did you run rasterize.py? Press Enter to see exception...')
-            raise
+    async def getTexture(self):
+        # Joins during startup wait here for the rasterization.
+        if self.texture is None:
+            assert self.textureTask is not None
+            try:
+                self.texture = await asyncio.shield(self.textureTask)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Logged by `onTextureFailed`, which also shuts us down. 
+                raise TextureUnavailable()
+        return self.texture
     
     async def onPlayerLeave(self, uuid: str):
-        self.writers.pop(uuid)
-        self.gamestate.players = [p for p in self.gamestate.players if p.uuid != uuid]
-        self.gamestate.validate()
+        self.writers.pop(uuid, None)
+        self.acks.pop(uuid, None)
+        self.gamestate.removePlayer(uuid)
+        self.touch(uuid, StateField.CARDS)
         await self.broadcastGamestate()
     
-    def checkHash(self, event: dict):
-        if event[CEF.HASH] != self.gamestate.mutableHash():
-            print('Gamestate hash mismatch. Dropping client event:', event[CEF.TYPE])
-            raise HashMismatchError()
-    
     async def handleEvent(self, uuid: str, event: dict):
-        type_ = CET(event[CEF.TYPE])
+        '''
+        Applies one event, or a batch of events back-to-back without 
+        yielding to other clients, then broadcasts once.  
+        A batch is all or nothing: if an event in it fails, the ones 
+        before are rolled back and the rest dropped.  
+        '''
+        if event.get(CEF.TYPE) == CET.BATCH:
+            events = event.get(CEF.EVENTS)
+            if not isinstance(events, list) or not all(
+                isinstance(sub_event, dict) for sub_event in events
+            ):
+                raise JustWarnSourceUser('Malformed BATCH event: bad events')
+        else:
+            events = [event]
+        seqs = seqsOf(events)
+        # A lone event warns before it mutates anything. A batch is 
+        # snapshotted just before its first mutating event, if any. 
+        atomic = len(events) > 1
+        snapshot = None
+        outbox: Outbox = []
+        changed = False
+        flush_now = False
+        warning = None
+        try:
+            for sub_event in events:
+                if atomic and snapshot is None and mutates(sub_event):
+                    snapshot = self.snapshot()
+                if self.applyEvent(uuid, sub_event, outbox):
+                    changed = True
+                if sub_event[CEF.TYPE] in FLUSH_NOW_EVENTS:
+                    flush_now = True
+        except JustWarnSourceUser as e:
+            warning = e
+        except Exception:
+            if snapshot is not None:
+                self.restore(snapshot)
+            raise
+        if warning is not None and atomic:
+            if snapshot is not None:
+                self.restore(snapshot)
+            outbox.clear()
+            changed = flush_now = False
+        # Sequenced events were predicted by the client. 
+        # Ack them even if dropped, so the client rolls them back. 
+        if seqs:
+            self.acks[uuid] = max(seqs)
+        # Under the lock, so that side messages keep their order 
+        # among gamestates. 
+        async with self.gamestateLock:
+            for target_uuid, payload in outbox:
+                if target_uuid is None:
+                    await self.broadcast(payload)
+                else:
+                    await sendPayload(payload, self.writers[target_uuid])
+        if changed or seqs:
+            await self.requestBroadcast(flush_now)
+        if warning is not None:
+            raise warning
+    
+    async def onThrottled(
+        self, uuid: str, event: dict, writer: StreamWriter, throttled: Throttled, 
+    ):
+        # Ack predicted events like `handleEvent` does, so the client 
+        # rolls them back. Without a broadcast, which is what throttling 
+        # saves: the ack goes right away to the sender alone.  
+        try:
+            seqs = seqsOf(subEventsOf(event))
+        except JustWarnSourceUser:
+            seqs = []   # a broken client. The event is dropped anyway.
+        if seqs:
+            self.acks[uuid] = max(seqs)
+            await self.sendGamestate(writer)
+        if throttled.warn:
+            await sendPayload(self.popupPayload('Warning', str(throttled)), writer)
+
+    def applyEvent(self, uuid: str, event: dict, outbox: Outbox):
+        '''
+        Mutates the gamestate and queues any side messages in `outbox`.  
+        Returns whether the gamestate needs to be broadcast.  
+        '''
+        try:
+            type_ = CET(event[CEF.TYPE])
+            handler = HANDLERS[type_]
+        except (KeyError, ValueError):
+            raise JustWarnSourceUser(f'Unknown event type: {event.get(CEF.TYPE)}')
+        for field, expected in handler.schema.items():
+            check = expected if isinstance(expected, Check) else None
+            value = event.get(field)
+            if not isinstance(value, expected if check is None else check.types):
+                raise JustWarnSourceUser(
+                    f'Malformed {type_.value} event: bad {field.value}', 
+                )
+            if check is not None and not check.valid(self, value, event):
+                raise JustWarnSourceUser(
+                    f'Invalid {type_.value} event: {field.value} is not {check.what}', 
+                )
         myself = self.gamestate.seekPlayer(uuid)
-        print(f'client event: "{myself.name}" {type_.value}')
+        if handler.log:
+            print(f'client event: "{myself.name}" {type_.value}')
+        start = time.perf_counter()
         try:
-            if   type_ == CET.VOTE:
-                # self.checkHash(event)
-                myself.voting = Vote(event[CEF.VOTE])
-                if (
-                    myself.voting == Vote.ACCEPT and 
-                    self.gamestate.uniqueShoutSetPlayer() is None
-                ):
-                    myself.voting = Vote.IDLE
-                if not await self.resolveVotes():
-                    return
-            elif type_ == CET.CALL_SET:
-                # self.checkHash(event)
-                myself.shouted_set = time.time() - self.time_of_last_harvest
-                self.gamestate.clearVoteAccept()
-            elif type_ == CET.CANCEL_CALL_SET:
-                # self.checkHash(event)
-                myself.shouted_set = None
-                self.gamestate.clearVoteAccept()
-            elif type_ == CET.CHANGE_NAME:
-                value = event[CEF.TARGET_VALUE]
-                assert isinstance(value, str)
-                myself.name = value
-                print(f'{uuid[:4]} changed name to "{value}"')
-            elif type_ == CET.CHANGE_COLOR:
-                value = event[CEF.TARGET_VALUE]
-                assert isinstance(value, str)
-                try:
-                    r, g, b = [int(x.strip()) for x in value.split(',')]
-                    assert r in range(256)
-                    assert g in range(256)
-                    assert b in range(256)
-                except Exception as e:
-                    print(f'Warning: {uuid[:4]} submitted invalid color: "{value}", resulting in {e}')
-                    return
-                myself.color = f'{r},{g},{b}'
-            elif type_ == CET.TOGGLE_DISPLAY_CASE_VISIBLE:
-                target_uuid = event[CEF.TARGET_PLAYER]
-                player = self.gamestate.seekPlayer(target_uuid)
-                player.display_case_hidden = not player.display_case_hidden
-            elif type_ == CET.ACC_N_WINS:
-                target_uuid = event[CEF.TARGET_PLAYER]
-                player = self.gamestate.seekPlayer(target_uuid)
-                value = event[CEF.TARGET_VALUE]
-                assert isinstance(value, int)
-                player.n_of_wins += value
-            elif type_ == CET.ACC_PUBLIC_ZONE_SHAPE:
-                value = event[CEF.TARGET_VALUE]
-                self.reshapePublicZone(*value)
-            elif type_ == CET.TOGGLE_SELECT_CARD_PUBLIC:
-                x, y = event[CEF.TARGET_VALUE]
-                assert isinstance(x, int) and isinstance(y, int)
-                card = self.gamestate.public_zone[x][y]
-                if card is None:
-                    # print(f'Warning: {uuid[:4]} tried to toggle an empty card slot in public zone')
-                    return
-                card.toggle(uuid)
-                self.gamestate.clearVoteAccept()
-            elif type_ == CET.TOGGLE_SELECT_CARD_DISPLAY:
-                target_uuid = event[CEF.TARGET_PLAYER]
-                player = self.gamestate.seekPlayer(target_uuid)
-                x = event[CEF.TARGET_VALUE]
-                assert isinstance(x, int)
-                card = player.display_case[x]
-                if card is None:
-                    # print(f'Warning: {uuid[:4]} tried to toggle an empty card slot in display case')
-                    return
-                card.toggle(uuid)
-                self.gamestate.clearVoteAccept()
-            elif type_ == CET.CLEAR_MY_SELECTIONS:
-                for card in self.gamestate.AllSmartCards():
-                    if uuid in card.selected_by:
-                        card.selected_by.remove(uuid)
-            elif type_ == CET.DEAL_CARD:
-                # self.checkHash(event) # checking hash would prevent rapid dealing.
-                remaining: tp.List[Card] = []
-                for idx in iterAllCards():
-                    if self.gamestate.cards_in_deck[idx]:
-                        remaining.append(idx)
-                if not remaining:
-                    print(f'Warning: {uuid[:4]} tried to deal a card from the empty deck')
-                    return
-                vacant = None
-                for y, row in enumerate(self.gamestate.public_zone):
-                    for x, card in enumerate(row):
-                        if card is None:
-                            vacant = (x, y)
-                            break
-                    else:
-                        continue
-                    break
-                if vacant is None:
-                    print(f'Warning: {uuid[:4]} tried to deal a card into the full public zone')
-                    return
-                card = random.choice(remaining)
-                self.gamestate.cards_in_deck[card] = False
-                self.gamestate.public_zone[vacant[1]][vacant[0]] = SmartCard(
-                    card, time.time(), 
+            self.checkVersion(uuid, event, *handler.checks)
+            touched = handler.apply(self, uuid, myself, event, outbox)
+        except StaleEventError as e:
+            print('Stale event. Dropping client event:', type_.value, e)
+            raise JustWarnSourceUser(
+                f'{type_.value} canceled: the table changed before your click arrived ({e}).', 
+            )
+        finally:
+            for hook in self.timing_hooks:
+                hook(type_, time.perf_counter() - start)
+        if touched is None:
+            return False
+        if handler.mutates:
+            self.touch(uuid, *touched)
+        return handler.broadcast
+    
+    @handles(CET.VOTE, {CEF.VOTE: Check(str, isVote, 'a vote')})
+    def onVote(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        vote = Vote(event[CEF.VOTE])
+        if vote == Vote.ACCEPT:
+            winner = self.gamestate.uniqueShoutSetPlayer()
+            if winner is None:
+                vote = Vote.IDLE
+            else:
+                self.checkVersion(
+                    uuid, event, StateField.SHOUTS, StateField.CARDS, 
+                    (StateField.SELECTION, winner.uuid), 
                 )
-            elif type_ == CET.PING:
-                await sendPrimitive({
-                    SEF.TYPE: SET.PONG,
-                }, self.writers[uuid])
-                return
-            elif type_ == CET.TAKE:
-                # self.checkHash(event)
-                if not self.harvest(uuid):
-                    return
-            elif type_ == CET.UNDO:
-                undo_uuid = event[CEF.TARGET_VALUE]
-                assert isinstance(undo_uuid, str)
-                try:
-                    self.gamestate = self.undoTape.undoTo(self.gamestate.getUuids(), undo_uuid)
-                except UndoToFuture:
-                    raise JustWarnSourceUser('Undo canceled: Someone else either clicked undo at the same time as you tried to undo.')
-                else:
-                    self.time_of_last_harvest = time.time()
-            elif type_ == CET.SPEAK:
-                content = event[CEF.TARGET_VALUE]
-                assert isinstance(content, str)
-                await self.broadcast(self.popupPayload(
-                    f'{myself.name} said:', content, 
-                ))
+        myself.voting = vote
+        if not self.resolveVotes(uuid, outbox):
+            return None
+        return ()
+    
+    @handles(CET.CALL_SET)
+    def onCallSet(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        myself.shouted_set = time.time() - self.time_of_last_harvest
+        self.record(Kind.CALL_SET, uuid, myself.shouted_set)
+        self.gamestate.clearVoteAccept()
+        return (StateField.SHOUTS, )
+    
+    @handles(CET.CANCEL_CALL_SET)
+    def onCancelCallSet(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        myself.shouted_set = None
+        self.gamestate.clearVoteAccept()
+        return (StateField.SHOUTS, )
+    
+    @handles(CET.CHANGE_NAME, {CEF.TARGET_VALUE: str})
+    def onChangeName(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        value = event[CEF.TARGET_VALUE]
+        myself.name = value
+        print(f'{uuid[:4]} changed name to "{value}"')
+        return ()
+    
+    @handles(CET.CHANGE_COLOR, {CEF.TARGET_VALUE: str})
+    def onChangeColor(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        value = event[CEF.TARGET_VALUE]
+        try:
+            r, g, b = [int(x.strip()) for x in value.split(',')]
+            assert r in range(256)
+            assert g in range(256)
+            assert b in range(256)
+        except Exception as e:
+            print(f'Warning: {uuid[:4]} submitted invalid color: "{value}", resulting in {e}')
+            return None
+        myself.color = f'{r},{g},{b}'
+        return ()
+    
+    @handles(CET.TOGGLE_DISPLAY_CASE_VISIBLE, {CEF.TARGET_PLAYER: PLAYER})
+    def onToggleDisplayCaseVisible(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        player = self.gamestate.seekPlayer(event[CEF.TARGET_PLAYER])
+        player.display_case_hidden = not player.display_case_hidden
+        return ()
+    
+    @handles(CET.ACC_N_WINS, {CEF.TARGET_PLAYER: PLAYER, CEF.TARGET_VALUE: INT})
+    def onAccNWins(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        player = self.gamestate.seekPlayer(event[CEF.TARGET_PLAYER])
+        player.n_of_wins += event[CEF.TARGET_VALUE]
+        return ()
+    
+    @handles(CET.ACC_PUBLIC_ZONE_SHAPE, {
+        CEF.TARGET_VALUE: Check((list, tuple), isPairOfInts, 'a pair of integers'), 
+    })
+    def onAccPublicZoneShape(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        self.reshapePublicZone(*event[CEF.TARGET_VALUE])
+        return ()
+    
+    @handles(CET.TOGGLE_SELECT_CARD_PUBLIC, {
+        CEF.TARGET_VALUE: Check((list, tuple), isPublicSlot, 'a slot of the public zone'), 
+    })
+    def onToggleSelectCardPublic(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        x, y = event[CEF.TARGET_VALUE]
+        card = self.gamestate.public_zone[x][y]
+        if card is None:
+            # print(f'Warning: {uuid[:4]} tried to toggle an empty card slot in public zone')
+            return None
+        self.gamestate.toggleSelection(card, uuid)
+        self.gamestate.clearVoteAccept()
+        return ((StateField.SELECTION, uuid), )
+    
+    @handles(CET.TOGGLE_SELECT_CARD_DISPLAY, {
+        CEF.TARGET_PLAYER: PLAYER, 
+        CEF.TARGET_VALUE: Check(int, isDisplaySlot, 'a slot of their display case'), 
+    })
+    def onToggleSelectCardDisplay(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        player = self.gamestate.seekPlayer(event[CEF.TARGET_PLAYER])
+        card = player.display_case[event[CEF.TARGET_VALUE]]
+        if card is None:
+            # print(f'Warning: {uuid[:4]} tried to toggle an empty card slot in display case')
+            return None
+        self.gamestate.toggleSelection(card, uuid)
+        self.gamestate.clearVoteAccept()
+        return ((StateField.SELECTION, uuid), )
+    
+    @handles(CET.CLEAR_MY_SELECTIONS)
+    def onClearMySelections(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        self.gamestate.clearSelections(uuid)
+        return ((StateField.SELECTION, uuid), )
+    
+    @handles(CET.DEAL_CARD)
+    def onDealCard(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        # Dealing never conflicts, so rapid dealing is fine.
+        return () if self.deal(uuid, 1) else None
+    
+    @handles(CET.DEAL_CARDS, {
+        CEF.TARGET_VALUE: Check(int, isDealable, 'a number of cards the deck and the public zone can take'), 
+    })
+    def onDealCards(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        return () if self.deal(uuid, event[CEF.TARGET_VALUE]) else None
+    
+    @handles(CET.DEAL_TO_FILL)
+    def onDealToFill(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        return () if self.deal(uuid, max(1, self.dealer.nVacancies())) else None
+    
+    # Outside of batches, `handleClient` answers PINGs before dispatch. 
+    @handles(CET.PING, mutates=False, broadcast=False, log=False)
+    def onPing(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        outbox.append((uuid, PONG_PAYLOAD))
+        return None
+    
+    @handles(CET.TAKE, checks=(StateField.CARDS, ))
+    def onTake(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        return () if self.harvest(uuid, uuid) else None
+    
+    @handles(CET.UNDO, {CEF.TARGET_VALUE: str}, checks=(StateField.TAPE, ))
+    def onUndo(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        try:
+            self.gamestate = self.undoTape.undoTo(
+                self.gamestate.getUuids(), event[CEF.TARGET_VALUE], 
+            )
+        except UndoToFuture:
+            raise JustWarnSourceUser('Undo canceled: Someone else either clicked undo at the same time as you tried to undo.')
+        self.dealer.rebuild(self.gamestate)
+        self.time_of_last_harvest = time.time()
+        self.touchAll(uuid)
+        self.record(Kind.UNDO, uuid)
+        return ()
+    
+    # Only a popup. The gamestate is untouched. 
+    @handles(CET.SPEAK, {CEF.TARGET_VALUE: str}, mutates=False, broadcast=False)
+    def onSpeak(self, uuid: str, myself: Player, event: dict, outbox: Outbox):
+        outbox.append((None, self.popupPayload(
+            f'{myself.name} said:', event[CEF.TARGET_VALUE], 
+        )))
+        return ()
+    
+    def snapshot(self):
+        # The tape's memories are never mutated, so a shallow copy does. 
+        return Snapshot(
+            copy.deepcopy(self.gamestate), [*self.undoTape.tape], 
+            copy.deepcopy(self.dealer), self.version, 
+            {**self.field_versions}, self.epoch, self.time_of_last_harvest, 
+        )
+    
+    def restore(self, snapshot: Snapshot):
+        # Analytics already recorded stay: they are flushed on their own. 
+        self.gamestate = snapshot.gamestate
+        self.undoTape.tape = snapshot.tape
+        self.dealer = snapshot.dealer
+        self.version = snapshot.version
+        self.field_versions = snapshot.field_versions
+        self.epoch = snapshot.epoch
+        self.time_of_last_harvest = snapshot.time_of_last_harvest
+    
+    def touch(self, by: str | None, *keys: VersionKey):
+        self.version += 1
+        for key in keys:
+            self.field_versions[key] = (self.version, by)
+    
+    def touchAll(self, by: str | None):
+        self.version += 1
+        self.field_versions.clear()
+        self.epoch = (self.version, by)
+    
+    def checkVersion(self, uuid: str, event: dict, *keys: VersionKey):
+        '''
+        Compare-and-set: raises if another player changed any of `keys` 
+        after the version the event was based on.  
+        '''
+        base = event.get(CEF.BASE_VERSION)
+        if base is None:
+            return
+        if type(base) is not int:
+            raise JustWarnSourceUser(
+                f'Malformed {CET(event[CEF.TYPE]).value} event: bad {CEF.BASE_VERSION.value}', 
+            )
+        stale = []
+        for key in keys:
+            version, by = self.field_versions.get(key, self.epoch)
+            if version > base and by != uuid:
+                stale.append(key[0].value if isinstance(key, tuple) else key.value)
+        if stale:
+            raise StaleEventError(', '.join(stale))
+    
+    def deal(self, uuid: str, n: int):
+        n_dealt = self.dealer.deal(self.gamestate, n)
+        if n_dealt == 0:
+            if self.gamestate.nCardsInDeck() == 0:
+                print(f'Warning: {uuid[:4]} tried to deal a card from the empty deck')
             else:
-                raise ValueError(f'Unknown event type: {type_}')
-            await self.broadcast(self.gamestatePacket())
-        except HashMismatchError:
-            pass
+                print(f'Warning: {uuid[:4]} tried to deal a card into the full public zone')
+        else:
+            self.record(Kind.DEAL, uuid, n_dealt)
+        return n_dealt
+    
+    def record(self, kind: Kind, uuid: str, value: float = 0.0):
+        if self.analytics is None:
+            return
+        # Player names outlive uuids, which are per connection. 
+        self.analytics.record(kind, self.gamestate.seekPlayer(uuid).name, value)
+        if self.analytics.isDue():
+            task = asyncio.create_task(self.analytics.flushInThread())
+            self.analyticsFlushes.add(task)
+            task.add_done_callback(self.onAnalyticsFlushed)
+    
+    def onAnalyticsFlushed(self, task: asyncio.Task):
+        self.analyticsFlushes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print('Warning: cannot write analytics.', task.exception())
     
     def reshapePublicZone(self, acc_n_rows: int, acc_n_cols: int):
         zone = self.gamestate.public_zone
@@ -373,8 +1047,10 @@ class Server:
             break
         assert not stashed
         self.gamestate.public_zone = zone
+        self.gamestate.reindex()
+        self.dealer.rebuild(self.gamestate)
     
-    async def resolveVotes(self):
+    def resolveVotes(self, uuid: str, outbox: Outbox):
         votes: tp.Set[Vote] = set()
         for player in self.gamestate.players:
             votes.add(player.voting)
@@ -388,7 +1064,7 @@ class Server:
             return
         elif consensus == Vote.NEW_GAME:
             self.undoTape.recordNewState(self.gamestate)
-            self.gamestate.cards_in_deck = Gamestate.fullDeck()
+            self.gamestate.deck_mask = Gamestate.fullDeck()
             for row in self.gamestate.public_zone:
                 for i in range(len(row)):
                     row[i] = None
@@ -397,11 +1073,15 @@ class Server:
                 player.shouted_set = None
                 player.wealth_thickness = 0
                 player.display_case = Player.newDisplayCase()
+            self.gamestate.reindex()
+            self.dealer.rebuild(self.gamestate)
             self.time_of_last_harvest = time.time()
+            self.touchAll(uuid)
+            self.record(Kind.NEW_GAME, uuid)
         elif consensus == Vote.ACCEPT:
             winner = self.gamestate.uniqueShoutSetPlayer()
             assert winner is not None
-            return self.harvest(winner.uuid)
+            return self.harvest(winner.uuid, uuid)
         elif consensus == Vote.COUNT_CARDS:
             buf = io.StringIO()
             for player in self.gamestate.players:
@@ -411,7 +1091,7 @@ class Server:
                 print(player.name, ':', score, file=buf)
             buf.seek(0)
             payload = self.popupPayload('Count cards', buf.read())
-            await self.broadcast(payload)
+            outbox.append((None, payload))
         else:
             raise ValueError(f'Unknown vote: {consensus}')
         return True
@@ -422,49 +1102,114 @@ class Server:
             SEF.CONTENT: (title, content),
         })
     
-    def harvest(self, taker_uuid: str):
-        self.undoTape.recordNewState(self.gamestate)
-        taker = self.gamestate.seekPlayer(taker_uuid)
-        the_set: tp.List[SmartCard] = []
-        for row in self.gamestate.public_zone:
-            for i, card in enumerate(row):
-                if card is None:
-                    continue
-                if taker_uuid in card.selected_by:
-                    the_set.append(card)
-                    row[i] = None
-        for player in self.gamestate.players:
-            taken = False
-            for i, card in enumerate(player.display_case):
-                if card is None:
-                    continue
-                if taker_uuid in card.selected_by:
-                    the_set.append(card)
-                    taken = True
-                    player.display_case[i] = None
-            if taken or player.uuid == taker_uuid:
-                for card in player.display_case:
-                    if card is not None:
-                        taker.wealth_thickness += 1
-                player.display_case = Player.newDisplayCase()
-        if not the_set:
-            _, self.gamestate = self.undoTape.forceUndo(self.gamestate.getUuids())
+    def harvest(self, taker_uuid: str, by: str):
+        gamestate = self.gamestate
+        if not gamestate.selectedBy(taker_uuid):
             return False
+        self.undoTape.recordNewState(gamestate)
+        taker = gamestate.seekPlayer(taker_uuid)
+        player_order = {uuid: i for i, uuid in enumerate(gamestate.getUuids())}
+        slots = sorted(
+            [gamestate.slotOf(card) for card in gamestate.selectedBy(taker_uuid)], 
+            # public zone first, then display cases in player order
+            key=lambda slot: (
+                slot.owner is not None, player_order.get(slot.owner, -1), 
+                slot.y, slot.x, 
+            ), 
+        )
+        the_set: tp.List[SmartCard] = []
+        robbed = {taker_uuid}
+        for slot in slots:
+            card = gamestate.takeCard(slot)
+            gamestate.unselectAll(card)
+            the_set.append(card)
+            if slot.owner is None:
+                self.dealer.vacate(slot.y, slot.x)
+            else:
+                robbed.add(slot.owner)
+        for uuid in robbed:
+            taker.wealth_thickness += gamestate.clearDisplayCase(
+                gamestate.seekPlayer(uuid), 
+            )
         for i, card in enumerate(the_set):
-            card.selected_by.clear()
-            card.birth = time.time()
-            try:
-                taker.display_case[i] = card
-            except IndexError:
-                print('Error: tried to take more than 4 cards into display case')
+            if i >= len(taker.display_case):
+                print(f'Error: tried to take more than {len(taker.display_case)} cards into display case')
                 break
+            card.birth = time.time()
+            gamestate.putCard(Slot(taker_uuid, 0, i), card)
+        self.record(Kind.HARVEST, taker_uuid, time.time() - self.time_of_last_harvest)
         self.time_of_last_harvest = time.time()
-        for player in self.gamestate.players:
+        for player in gamestate.players:
             player.shouted_set = None
+        self.touch(
+            by, StateField.CARDS, StateField.SHOUTS, StateField.TAPE, 
+            (StateField.SELECTION, taker_uuid), 
+        )
         return True
 
+async def acceptHandshake(reader: StreamReader, writer: StreamWriter):
+    '''
+    The table the new connection asks for. None, and the connection is 
+    closed, if it didn't handshake.  
+    '''
+    addr = writer.get_extra_info('peername')
+    print(f'New connection from {addr}')
+    try:
+        handshake = await recvPrimitive(reader)
+    except Exception as e:
+        handshake = None
+        print(f'Someone didn\'t handshake and caused {e}. Duh.')
+    protocol = protocolOf(handshake)
+    if protocol is not None and protocol != PROTOCOL_VERSION:
+        print(f'Turning away {addr}: protocol {protocol}, expected {PROTOCOL_VERSION}')
+        try:
+            await sendPrimitive({
+                SEF.TYPE: SET.POPUP_MESSAGE,
+                SEF.CONTENT: ('Version mismatch', (
+                    f'The server speaks protocol {PROTOCOL_VERSION}, '
+                    f'your client {protocol}. Update your client.'
+                )),
+            }, writer)
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        writer.close()
+        return None
+    table = tableOf(handshake)
+    if table is None:
+        print(f'Handshake failed for {addr} --- expected {handshakeOf(DEFAULT_TABLE)}, got {handshake}')
+        writer.close()
+    return table
+
+def processPool():
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    # spawn: forking a process that runs threads may deadlock
+    return ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'))
+
+def prepareTexture():
+    import rasterize    # and thus env.py, which only the texture needs
+    try:
+        if rasterize.rasterize():
+            print('Texture rasterized.')
+    except (ImportError, OSError) as e:
+        # e.g. Cairo is missing. An outdated texture is still playable.
+        if not os.path.isfile(PNG):
+            print('Error: cannot rasterize the texture, and there is no old one to serve.')
+            raise
+        print('Warning: cannot rasterize the texture, serving the old one.', e)
+    with open(PNG, 'rb') as f:
+        return gzip.compress(f.read())
+
+def onTextureFailed(task: asyncio.Task, shutDown: tp.Callable[[], tp.Any]):
+    # Done callback of a `prepareTexture` task. No texture, no game. 
+    if task.cancelled() or task.exception() is None:
+        return
+    print('Error: no texture to serve. Shutting down.')
+    traceback.print_exception(task.exception())
+    shutDown()
+
 def main():
-    server = Server()
+    server = Server(int(input('Port > ')))
     try:
         asyncio.run(server.start())
     except KeyboardInterrupt:
@@ -6,21 +6,58 @@ import os
 from enum import Enum
 import gzip
 import json
-import asyncio
-from hashlib import sha256
+import re
 
-from tqdm import tqdm
+from deck import Deck, Card
 
-PACKET_LEN_PREFIX_LEN = 8
+if tp.TYPE_CHECKING:
+    import asyncio
 
-Card = tp.Tuple[int, int, int, int]
+PACKET_LEN_PREFIX_LEN = 8
 
 CARD_ASPECT = (43, 62)
 
 SVG = './texture.svg'
 PNG = './cache/texture.png'
+TEXTURE_MANIFEST = './cache/texture.json'
 
 HANDSHAKE = 'I solemnly swear that I am up to no good.'
+# Bump on any change to the wire format. Client and server must agree. 
+# 2: int card ids, hex deck mask, gamestate before texture. 
+PROTOCOL_VERSION = 2
+# Clients that don't name a table sit here. 
+DEFAULT_TABLE = 'default'
+# Table names end up in file paths, e.g. of the analytics. 
+TABLE_NAME = re.compile(r'[A-Za-z0-9_-]{1,32}')
+
+def handshakeOf(table: str):
+    return [HANDSHAKE, table, PROTOCOL_VERSION]
+
+def protocolOf(handshake: tp.Any) -> int | None:
+    '''
+    The protocol version a handshake speaks, 1 if it predates versions, 
+    or None if it is not a handshake.  
+    '''
+    if handshake == HANDSHAKE:
+        return 1
+    if not isinstance(handshake, list) or not handshake or handshake[0] != HANDSHAKE:
+        return None
+    if len(handshake) == 3 and type(handshake[2]) is int:
+        return handshake[2]
+    return 1
+
+def tableOf(handshake: tp.Any) -> str | None:
+    '''
+    The table a handshake asks for, or None if it is not a handshake, 
+    or the name is not a `TABLE_NAME`.  
+    '''
+    if (
+        isinstance(handshake, list) and len(handshake) == 3 and 
+        handshake[0] == HANDSHAKE and isinstance(handshake[1], str) and 
+        TABLE_NAME.fullmatch(handshake[1])
+    ):
+        return handshake[1]
+    return None
 
 def boolsToBytes(bools: tp.Iterator[bool]) -> bytes:
     byte_array = bytearray()
@@ -57,12 +94,19 @@ def testBitsConversion():
         unpacked_bools = list(bytesToBools(packed_bytes))[:n]
         assert bool_list == unpacked_bools
 
-def iterAllCards():
-    for c in range(3):
-        for f in range(3):
-            for n in range(3):
-                for s in range(3):
-                    yield (c, f, n, s)
+# (attributes, values per attribute). The texture sheet must match. 
+DECK_SHAPE = (4, 3)
+DECK = Deck(*DECK_SHAPE)
+
+iterAllCards = DECK.iterAllCards
+# A card id is the index of the card in `iterAllCards()`. 
+# It is also the wire encoding of the card. 
+cardId = DECK.cardId
+cardOf = DECK.cardOf
+N_CARDS = DECK.n_cards
+# A set, plus one spare slot. 4 for the classic deck. 
+DISPLAY_CASE_SIZE = DECK.n_values + 1
+FULL_DECK_MASK = DECK.full_mask
 
 class Vote(str, Enum):
     IDLE = 'IDLE'
@@ -75,19 +119,24 @@ class ServerEventField(str, Enum):
     TYPE = 'type'
     CONTENT = 'content'
     LAST_UNDO_UUID = 'last_undo_uuid'
+    ACKS = 'acks'   # uuid -> last applied client sequence number
+    VERSION = 'version'
 
 class ServerEventType(str, Enum):
     GAMESTATE = 'GAMESTATE'
     YOU_ARE = 'YOU_ARE'
     POPUP_MESSAGE = 'POPUP_MESSAGE'
     PONG = 'PONG'
+    REDIRECT = 'REDIRECT'   # content: the port to reconnect to
 
 class ClientEventField(str, Enum):
     TYPE = 'type'
-    HASH = 'gamestate_hash'
+    BASE_VERSION = 'base_version'   # the gamestate version the event was based on
     VOTE = 'vote'
     TARGET_VALUE = 'target_value'
     TARGET_PLAYER = 'target_player'
+    EVENTS = 'events'
+    SEQ = 'seq'
 
 class ClientEventType(str, Enum):
     VOTE = 'VOTE'
@@ -102,15 +151,21 @@ class ClientEventType(str, Enum):
     TOGGLE_SELECT_CARD_DISPLAY = 'TOGGLE_SELECT_CARD_DISPLAY'
     CLEAR_MY_SELECTIONS = 'CLEAR_MY_SELECTIONS'
     DEAL_CARD = 'DEAL_CARD'
+    DEAL_CARDS = 'DEAL_CARDS'
+    DEAL_TO_FILL = 'DEAL_TO_FILL'
     PING = 'PING'
     TAKE = 'TAKE'
     UNDO = 'UNDO'
     SPEAK = 'SPEAK'
+    BATCH = 'BATCH'
 
-def sendPrefix(payload_size: int, writer: asyncio.StreamWriter):
+def prefixOf(payload_size: int):
     prefix = format(payload_size, f'0{PACKET_LEN_PREFIX_LEN}d').encode()
     assert len(prefix) <= PACKET_LEN_PREFIX_LEN
-    writer.write(prefix)
+    return prefix
+
+def sendPrefix(payload_size: int, writer: asyncio.StreamWriter):
+    writer.write(prefixOf(payload_size))
 
 async def sendPayload(payload: bytes, writer: asyncio.StreamWriter):
     sendPrefix(len(payload), writer)
@@ -123,30 +178,35 @@ async def streamPayload(payload: bytes, writer: asyncio.StreamWriter):
         writer.write(payload[i:i+1024])
         await writer.drain()
 
-async def recvStream(reader: asyncio.StreamReader):
+async def iterStream(reader: asyncio.StreamReader):
+    # Lets the receiver consume a stream as it arrives.
+    from tqdm import tqdm   # only ever needed for the texture
     prefix = await reader.readexactly(PACKET_LEN_PREFIX_LEN)
     payload_len = int(prefix)
-    payload = []
     for _ in tqdm(range(payload_len // 1024), desc='Downloading', unit='KB'):
-        payload.append(await reader.readexactly(1024))
-    payload.append(await reader.readexactly(payload_len % 1024))
-    return b''.join(payload)
+        yield await reader.readexactly(1024)
+    yield await reader.readexactly(payload_len % 1024)
+
+async def recvStream(reader: asyncio.StreamReader):
+    return b''.join([chunk async for chunk in iterStream(reader)])
 
 def primitiveToPayload(x, /):
     payload = gzip.compress(json.dumps(x).encode())
     return payload
 
+def payloadToPrimitive(payload: bytes, /):
+    return json.loads(gzip.decompress(payload))
+
 async def sendPrimitive(x, /, writer: asyncio.StreamWriter):
     await sendPayload(primitiveToPayload(x), writer)
 
-async def recvPrimitive(reader: asyncio.StreamReader):
+async def recvPayload(reader: asyncio.StreamReader):
     prefix = await reader.readexactly(PACKET_LEN_PREFIX_LEN)
     payload_len = int(prefix)
-    payload = await reader.readexactly(payload_len)
-    return json.loads(gzip.decompress(payload))
+    return await reader.readexactly(payload_len)
 
-def deterministicHash(x: tp.Any, /):
-    return sha256(json.dumps(x).encode()).hexdigest()
+async def recvPrimitive(reader: asyncio.StreamReader):
+    return payloadToPrimitive(await recvPayload(reader))
 
 def rgbToHex(r: int, g: int, b: int):
     return f'#{r:02x}{g:02x}{b:02x}'
@@ -0,0 +1,239 @@
+'''
+Runs the server on several cores: `N_WORKERS` worker processes, each
+hosting its share of the tables, behind a front acceptor.
+A client handshakes with the acceptor, naming its table. The acceptor
+answers with a REDIRECT to the port of the worker owning that table,
+and the client reconnects there. So the acceptor never touches game
+traffic, and a table's players all share one process.
+Worker i listens on `port + 1 + i`, which must be reachable too.
+Usage: `python supervisor.py`.
+'''
+
+from __future__ import annotations
+
+import typing as tp
+import os
+import asyncio
+from asyncio import StreamReader, StreamWriter
+import zlib
+import signal
+import traceback
+import multiprocessing
+
+from shared import *
+from shared import ServerEventType as SET, ServerEventField as SEF
+from server import Server, acceptHandshake, prepareTexture, onTextureFailed
+
+# None: one per core
+N_WORKERS: int | None = None
+# Clients asking for yet another table are turned away.
+MAX_TABLES_PER_WORKER = 64
+# On shutdown, workers get this long to close their tables before being killed.
+WORKER_SHUTDOWN_TIMEOUT = 5.0 # sec
+
+def ownerOf(table: str, n_workers: int):
+    # Stable across processes and runs, unlike `hash`.
+    return zlib.crc32(table.encode()) % n_workers
+
+class Table(tp.NamedTuple):
+    server: Server
+    task: asyncio.Task
+    clients: tp.Set[asyncio.Task]
+
+class Worker:
+    '''
+    One process. Opens a table on its first client, and closes it when 
+    the last one leaves.
+    '''
+    def __init__(self, port: int, **server_kw):
+        self.port = port
+        self.server_kw = server_kw
+        self.tables: tp.Dict[str, Table] = {}
+        # Tables still closing. A new one of the same name waits for it, 
+        # so that the two don't write the same analytics at once. 
+        self.closing: tp.Dict[str, asyncio.Task] = {}
+        self.textureTask: asyncio.Task[bytes] | None = None
+
+    async def openTable(self, name: str):
+        try:
+            return self.tables[name]
+        except KeyError:
+            pass
+        if name in self.closing:
+            await asyncio.shield(self.closing[name])
+            return await self.openTable(name)   # someone may have opened it meanwhile
+        if len(self.tables) >= MAX_TABLES_PER_WORKER:
+            return None
+        server = Server(self.port, table=name, **self.server_kw)
+        # All tables serve the same texture. Rasterize it once.
+        server.textureTask = self.textureTask
+        table = self.tables[name] = Table(
+            server, asyncio.create_task(server.start(listen=False)), set(), 
+        )
+        return table
+
+    async def closeTable(self, name: str):
+        table = self.tables.pop(name)
+        table.task.cancel()
+        try:
+            await table.task
+        except asyncio.CancelledError:
+            pass
+
+    async def handleClient(self, reader: StreamReader, writer: StreamWriter):
+        name = await acceptHandshake(reader, writer)
+        if name is None:
+            return
+        table = await self.openTable(name)
+        if table is None:
+            print(f'Turning away a client of table {name!r}: too many tables')
+            try:
+                await sendPrimitive({
+                    SEF.TYPE: SET.POPUP_MESSAGE,
+                    SEF.CONTENT: ('Server full', 'Too many tables. Try an existing one.'),
+                }, writer)
+            except (ConnectionResetError, BrokenPipeError):
+                pass
+            writer.close()
+            return
+        task = asyncio.current_task()
+        assert task is not None
+        table.clients.add(task)
+        try:
+            await table.server.serveClient(reader, writer)
+        finally:
+            table.clients.discard(task)
+            if not table.clients and self.tables.get(name) is table:
+                self.closing[name] = asyncio.create_task(self.closeTable(name))
+                try:
+                    await asyncio.shield(self.closing[name])
+                finally:
+                    del self.closing[name]
+
+    async def start(self):
+        print(f'Starting worker on port {self.port}...')
+        this = asyncio.current_task()
+        assert this is not None
+        def onTerminate():
+            # Like Ctrl+C: once, so that a second signal can't cut the cleanup short.
+            if not this.cancelling():
+                this.cancel()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, onTerminate)
+        except NotImplementedError:
+            pass    # Windows. `terminate` kills right away.
+        def reportMemory():
+            for name, table in self.tables.items():
+                if table.server.accountant is not None:
+                    print(f'Table {name!r}:')
+                    table.server.accountant.report()
+        if hasattr(signal, 'SIGUSR1'):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, reportMemory)
+        self.textureTask = asyncio.create_task(asyncio.to_thread(prepareTexture))
+        self.textureTask.add_done_callback(
+            lambda task: onTextureFailed(task, onTerminate), 
+        )
+        # Not `serve_forever`, which on cancel waits for every connection 
+        # to close before any cleanup of ours could close them. 
+        server = await asyncio.start_server(self.handleClient, '', self.port)
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            print('worker closing...')
+        finally:
+            server.close()
+            # The clients, who leave their tables in order, which then close. 
+            tables = [*self.tables.values()]
+            clientTasks = [task for table in tables for task in table.clients]
+            for task in clientTasks:
+                task.cancel()
+            await asyncio.gather(*clientTasks, return_exceptions=True)
+            for table in tables:
+                table.task.cancel()
+            await asyncio.gather(
+                *[table.task for table in tables], *self.closing.values(), 
+                return_exceptions=True, 
+            )
+            await server.wait_closed()
+        print('ok')
+
+def runWorker(port: int, server_kw: tp.Dict[str, tp.Any]):
+    # The entry point of a worker process.
+    try:
+        asyncio.run(Worker(port, **server_kw).start())
+    except KeyboardInterrupt:
+        pass
+
+class Supervisor:
+    def __init__(
+        self, port: int, n_workers: int | None = N_WORKERS, **server_kw,
+    ):
+        self.port = port
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.server_kw = server_kw
+        self.workers: tp.List[multiprocessing.process.BaseProcess] = []
+
+    def workerPort(self, table: str):
+        return self.port + 1 + ownerOf(table, self.n_workers)
+
+    async def handleClient(self, reader: StreamReader, writer: StreamWriter):
+        table = await acceptHandshake(reader, writer)
+        if table is None:
+            return
+        try:
+            await sendPrimitive({
+                SEF.TYPE: SET.REDIRECT,
+                SEF.CONTENT: self.workerPort(table),
+            }, writer)
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        writer.close()
+
+    async def start(self):
+        # Once here, so that a missing texture fails before any worker 
+        # starts. The workers then find it cached. 
+        try:
+            await asyncio.to_thread(prepareTexture)
+        except Exception:
+            print('Error: no texture to serve.')
+            traceback.print_exc()
+            return
+        print(f'Starting {self.n_workers} workers...')
+        # spawn: the workers don't need anything of this process
+        context = multiprocessing.get_context('spawn')
+        for i in range(self.n_workers):
+            worker = context.Process(
+                target=runWorker, args=(self.port + 1 + i, self.server_kw),
+                daemon=True,
+            )
+            worker.start()
+            self.workers.append(worker)
+        print(f'Starting acceptor on port {self.port}...')
+        server = await asyncio.start_server(self.handleClient, '', self.port)
+        print('I\'m ready for client connections!')
+        async with server:
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                print('supervisor closing...')
+            finally:
+                for worker in self.workers:
+                    worker.terminate()
+                for worker in self.workers:
+                    worker.join(WORKER_SHUTDOWN_TIMEOUT)
+                    if worker.is_alive():
+                        worker.kill()
+                        worker.join()
+        print('ok')
+
+def main():
+    port = int(input('Port > '))
+    n_workers = input(f'Workers (Enter for {os.cpu_count()}) > ').strip()
+    supervisor = Supervisor(port, int(n_workers) if n_workers else N_WORKERS)
+    try:
+        asyncio.run(supervisor.start())
+    except KeyboardInterrupt:
+        print('bye')
+
+if __name__ == '__main__':
+    main()
@@ -1,49 +1,101 @@
 '''
-[c, f, n, s], i.e., [color, fill, number, shape]
+Card sprites, cropped from the sheet at `DECK.sheetPosition`.  
+PIL is imported lazily, so that the client can show the board first.
 '''
+from __future__ import annotations
+
 import random
+import zlib
 
-from PIL import Image, ImageTk
 import tkinter as tk
 
 from shared import *
 from env_wrap import *
 
+if tp.TYPE_CHECKING:
+    from PIL import Image, ImageTk
+
+# zoom levels the client can step through
+ZOOM_LADDER = (0.5, 0.625, 0.75, 0.875, 1.0, 1.25, 1.5, 1.75, 2.0)
+DEFAULT_ZOOM_STEP = ZOOM_LADDER.index(1.0)
+
 def bboxOf(x: int, y: int):
     return (x * CARD_TEXTURE_RESOLUTION[0], y * CARD_TEXTURE_RESOLUTION[1], (x + 1) * CARD_TEXTURE_RESOLUTION[0], (y + 1) * CARD_TEXTURE_RESOLUTION[1])
 
 class Texture:
-    def __init__(self, tkRoot: tk.Tk):
+    '''
+    Card sprites at every zoom level of `ZOOM_LADDER`, i.e., a texture 
+    pyramid. Sprites of a level are resized from the largest level 
+    the first time they are asked for, and are kept afterwards, so 
+    switching zoom back and forth is cheap.  
+    '''
+    def __init__(self, tkRoot: tk.Tk, family_photo: Image.Image | None = None):
         _ = tkRoot  # Just lexical message, because root is required by ImageTk.PhotoImage.
+        # Only `get` touches Tk, so the rest may run in a worker thread.
+        from PIL import Image
 
-        family_photo = Image.open(PNG)
+        if family_photo is None:
+            family_photo = Image.open(PNG)
 
-        self.photoImgs: tp.Dict[tp.Tuple[
-            int, int, int, int, bool, 
-        ], ImageTk.PhotoImage] = {}
-        self.just_trying_to_have_a_reference = []
-        for c, f, n, s in iterAllCards():
-            cropped = family_photo.crop(bboxOf(
-                c * 3 + f, n * 3 + s, 
-            ))
+        self.zoom = 1.0
+        self.sources: tp.List[Image.Image] = []
+        self.photoImgs: tp.Dict[tp.Tuple[int, bool, float], ImageTk.PhotoImage] = {}
+        for card_id in range(N_CARDS):
+            cropped = family_photo.crop(bboxOf(*DECK.sheetPosition(card_id)))
             de_bordered = cropped.crop((
                 round(CARD_TEXTURE_RESOLUTION[0] * 0.1),
                 round(CARD_TEXTURE_RESOLUTION[1] * 0.1),
                 round(CARD_TEXTURE_RESOLUTION[0] * 0.9),
                 round(CARD_TEXTURE_RESOLUTION[1] * 0.9),
             ))
-            resized = de_bordered.resize((CARD_WIDTH, CARD_HEIGHT))
-            self.just_trying_to_have_a_reference.append(resized)
-            self.photoImgs[(c, f, n, s, False)] = ImageTk.PhotoImage(resized)
-            small = resized.resize((
-                round(SMALL_CARD_RATIO * CARD_WIDTH),
-                round(SMALL_CARD_RATIO * CARD_HEIGHT),
-            ))
-            self.just_trying_to_have_a_reference.append(small)
-            self.photoImgs[(c, f, n, s, True)] = ImageTk.PhotoImage(small)
+            # the base of the pyramid: the largest zoom, resized down from
+            self.sources.append(de_bordered.resize((
+                round(ZOOM_LADDER[-1] * CARD_WIDTH),
+                round(ZOOM_LADDER[-1] * CARD_HEIGHT),
+            )))
+    
+    def setZoom(self, zoom: float):
+        assert zoom in ZOOM_LADDER
+        self.zoom = zoom
+    
+    def get(self, card_id: int, is_small: bool):
+        key = (card_id, is_small, self.zoom)
+        try:
+            return self.photoImgs[key]
+        except KeyError:
+            pass
+        from PIL import ImageTk
+        ratio = self.zoom * (SMALL_CARD_RATIO if is_small else 1.0)
+        resized = self.sources[card_id].resize((
+            round(ratio * CARD_WIDTH),
+            round(ratio * CARD_HEIGHT),
+        ))
+        photoImg = self.photoImgs[key] = ImageTk.PhotoImage(resized)
+        return photoImg
+
+class TextureDecoder:
+    '''
+    Un-gzips and decodes the PNG chunk by chunk, as it downloads.  
+    '''
+    def __init__(self):
+        from PIL import ImageFile
+        self.unzip = zlib.decompressobj(16 + zlib.MAX_WBITS)   # gzip
+        self.parser = ImageFile.Parser()
+        self.png = bytearray()
+    
+    def feed(self, chunk: bytes):
+        data = self.unzip.decompress(chunk)
+        self.png += data
+        self.parser.feed(data)
     
-    def get(self, c: int, f: int, n: int, s: int, is_small: bool):
-        return self.photoImgs[(c, f, n, s, is_small)]
+    def close(self, tkRoot: tk.Tk):
+        data = self.unzip.flush()
+        self.png += data
+        self.parser.feed(data)
+        family_photo = self.parser.close()
+        with open(PNG, 'wb') as f:
+            f.write(self.png)
+        return Texture(tkRoot, family_photo)
 
 def test():
     root = tk.Tk()
@@ -51,14 +103,11 @@ def test():
     texture = Texture(root)
 
     for _ in range(4):
-        c = random.randint(0, 2)
-        f = random.randint(0, 2)
-        n = random.randint(0, 2)
-        s = random.randint(0, 2)
+        card_id = random.randrange(N_CARDS)
         is_small = random.choice([True, False])
-        label = tk.Label(root, text=f'[{c=}, {f=}, {n=}, {s=}]')
+        label = tk.Label(root, text=str(cardOf(card_id)))
         label.pack(side=tk.LEFT)
-        img = texture.get(c, f, n, s, is_small)
+        img = texture.get(card_id, is_small)
         label = tk.Label(root, image=img)   # type: ignore
         label.pack(side=tk.LEFT)
 